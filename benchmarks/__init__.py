@@ -0,0 +1,3 @@
+"""
+Бенчмарки бота (запуск: python -m benchmarks.<имя>)
+"""
@@ -0,0 +1,116 @@
+"""
+Бенчмарк смешанной нагрузки чтение/запись на SQLite
+
+Сравнивает старый режим (rollback journal, одно соединение) с WAL
+и пулом соединений для чтения. Писатели имитируют поток /start и
+сообщений, читатели - админские запросы (статистика, список, профиль).
+
+Запуск:
+    python -m benchmarks.db_mixed --seconds 10 --users 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from bot.database import Database
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль в миллисекундах"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index] * 1000
+
+
+async def seed(db: Database, users: int):
+    """Начальное наполнение таблиц"""
+    async with db._transaction() as cursor:
+        await cursor.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)",
+            [(user_id, f"user{user_id}") for user_id in range(1, users + 1)],
+        )
+        await cursor.executemany(
+            "INSERT INTO messages (user_id, message_text) VALUES (?, ?)",
+            [(random.randint(1, users), "hello") for _ in range(users)],
+        )
+
+
+async def run_mode(name: str, path: str, args, **db_kwargs) -> Dict[str, List[float]]:
+    """Прогон одной конфигурации"""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    # Кэш профилей отключен: меряем именно SQLite
+    db = Database(path, user_cache_size=0, **db_kwargs)
+    await db.connect()
+    await seed(db, args.users)
+
+    latencies: Dict[str, List[float]] = {"write": [], "read": []}
+    deadline = time.monotonic() + args.seconds
+
+    async def writer():
+        while time.monotonic() < deadline:
+            user_id = random.randint(1, args.users * 2)
+            started = time.perf_counter()
+            await db.add_user(user_id, f"user{user_id}")
+            await db.save_message(user_id, "benchmark")
+            latencies["write"].append(time.perf_counter() - started)
+
+    async def reader():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            choice = random.random()
+            if choice < 0.2:
+                await db.get_stats()
+            elif choice < 0.3:
+                await db.get_users_page()
+            else:
+                await db.get_user(random.randint(1, args.users))
+            latencies["read"].append(time.perf_counter() - started)
+
+    await asyncio.gather(
+        *(writer() for _ in range(args.writers)),
+        *(reader() for _ in range(args.readers)),
+    )
+    await db.disconnect()
+
+    print(f"\n{name}")
+    for kind, values in latencies.items():
+        print(
+            f"  {kind:5}: {len(values) / args.seconds:8.0f} оп/сек  "
+            f"p50 {percentile(values, 50):7.2f} мс  "
+            f"p99 {percentile(values, 99):7.2f} мс  "
+            f"mean {statistics.fmean(values) * 1000 if values else 0:7.2f} мс"
+        )
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--pool", type=int, default=4, help="размер пула читателей")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await run_mode(
+            "rollback journal, одно соединение", path, args, read_pool_size=0, wal=False
+        )
+        await run_mode(
+            f"WAL, пул читателей ({args.pool})", path, args, read_pool_size=args.pool
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
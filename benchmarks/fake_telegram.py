@@ -0,0 +1,269 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов
+
+aiohttp сервер, который отвечает на запросы бота как Telegram:
+getMe, getUpdates, sendMessage, sendDocument, getChatMember,
+editMessageReplyMarkup, answerCallbackQuery и др. Задержка ответа
+и доля ошибок 429/5xx настраиваются.
+
+Служебные эндпоинты для нагрузочного теста:
+    POST /_push  - JSON-список обновлений в очередь getUpdates
+    GET  /_stats - число запросов и внедренных ошибок по методам
+
+Отдельный запуск (для ручной проверки бота):
+    python -m benchmarks.fake_telegram --port 8081 --latency-ms 30 --rate-429 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+
+BOT_ID = 123456
+BOT_TOKEN = f"{BOT_ID}:FAKE-TOKEN"
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+class FakeTelegramServer:
+    """Имитация Bot API с задержкой и ошибками"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8081,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        retry_after: int = 1,
+        subscribed_ratio: float = 1.0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.subscribed_ratio = subscribed_ratio
+
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def push_updates(self, updates: List[Dict[str, Any]]):
+        """Очередь обновлений, которые отдаст getUpdates"""
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def start(self):
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_post("/_push", self._handle_push)
+        app.router.add_get("/_stats", self._handle_stats)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # === Обработка запросов ===
+
+    async def _handle_push(self, request: web.Request) -> web.Response:
+        self.push_updates(await request.json())
+        return web.json_response({"ok": True})
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "errors": self.errors})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._read_params(request)
+        self.calls[method] += 1
+
+        if method != "getUpdates":
+            delay = self.latency + random.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+
+            roll = random.random()
+            if roll < self.rate_429:
+                self.errors[f"{method}:429"] += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    },
+                    status=429,
+                )
+            if roll < self.rate_429 + self.rate_5xx:
+                self.errors[f"{method}:500"] += 1
+                return web.json_response(
+                    {"ok": False, "error_code": 500, "description": "Internal Server Error"},
+                    status=500,
+                )
+
+        handler = getattr(self, f"_api_{method}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> Dict[str, Any]:
+        """Параметры запроса (aiogram шлет multipart/form-data, значения - JSON)"""
+        params: Dict[str, Any] = {}
+        if request.content_type == "application/json":
+            return await request.json()
+
+        form = await request.post()
+        for key, value in form.items():
+            if isinstance(value, str):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+            else:
+                # Загруженный файл
+                params[key] = value.filename
+        return params
+
+    def _message(self, chat_id: Any, **extra) -> Dict[str, Any]:
+        chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else -100
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot", "username": "fake_bot"},
+        }
+        message.update(extra)
+        return message
+
+    async def _api_getMe(self, params):
+        return {"id": BOT_ID, "is_bot": True, "first_name": "Bot", "username": "fake_bot"}
+
+    async def _api_getUpdates(self, params):
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+
+        # offset подтверждает уже полученные обновления
+        offset = int(params.get("offset") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    async def _api_sendMessage(self, params):
+        return self._message(params["chat_id"], text=params.get("text", ""))
+
+    async def _api_sendDocument(self, params):
+        file_id = f"fake-file-{next(self._message_ids)}"
+        return self._message(
+            params["chat_id"],
+            document={"file_id": file_id, "file_unique_id": file_id},
+            caption=params.get("caption"),
+        )
+
+    async def _api_copyMessage(self, params):
+        return {"message_id": next(self._message_ids)}
+
+    async def _api_copyMessages(self, params):
+        message_ids = params.get("message_ids") or []
+        if isinstance(message_ids, str):
+            message_ids = json.loads(message_ids)
+        return [{"message_id": next(self._message_ids)} for _ in message_ids]
+
+    async def _api_getChatMember(self, params):
+        user_id = int(params["user_id"])
+        # Детерминированно: одна и та же доля пользователей "подписана"
+        subscribed = (user_id * 2654435761 % 1000) < self.subscribed_ratio * 1000
+        return {"status": "member" if subscribed else "left", "user": _user(user_id)}
+
+    async def _api_editMessageReplyMarkup(self, params):
+        return self._message(params.get("chat_id", 0))
+
+    async def _api_editMessageText(self, params):
+        return self._message(params.get("chat_id", 0), text=params.get("text", ""))
+
+
+def make_bot(server_url: str, token: str = BOT_TOKEN) -> Bot:
+    """Бот, который ходит в локальный сервер вместо api.telegram.org"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(server_url))
+    return Bot(
+        token=token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+async def serve(**kwargs):
+    """Запуск сервера до отмены"""
+    server = FakeTelegramServer(**kwargs)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def run_server(**kwargs):
+    """Точка входа для отдельного процесса"""
+    try:
+        asyncio.run(serve(**kwargs))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0)
+    parser.add_argument("--rate-5xx", type=float, default=0)
+    args = parser.parse_args()
+
+    print(f"Fake Bot API: http://{args.host}:{args.port}/bot<token>/<method> (Ctrl+C - выход)")
+    run_server(
+        host=args.host,
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Нагрузочный тест воронки на локальном Bot API
+
+Поднимает benchmarks.fake_telegram в отдельном процессе (чтобы сервер
+не делил CPU с ботом), направляет в него Bot и прогоняет через
+диспетчер бота (bot.dispatcher - те же middleware, что в bot/main.py)
+тысячи синтетических обновлений: /start, нажатие "Я подписался" и
+обычное сообщение от каждого пользователя.
+Показывает обновлений/сек, p50/p99 времени обработки и пиковый RSS.
+
+С --scheduler работает и планировщик: после обновлений тест ждет,
+пока уйдут бонус и контакты (не быстрее JOB_RATE в секунду; задержку
+бонуса и контактов задают --bonus-delay и --contact-delay).
+
+Запуск:
+    python -m benchmarks.loadtest --users 5000 --concurrency 100 --latency-ms 20
+    python -m benchmarks.loadtest --mode polling --rate-429 0.01
+    JOB_RATE=100 python -m benchmarks.loadtest --users 500 --scheduler --bonus-delay 1 --contact-delay 1
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# Конфигурация бота читается при импорте: подставляем тестовые значения
+os.environ.setdefault("BOT_TOKEN", "123456:FAKE-TOKEN")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "@loadtest_channel")
+
+import aiohttp  # noqa: E402
+
+from benchmarks.db_mixed import percentile  # noqa: E402
+from benchmarks.fake_telegram import BOT_ID, make_bot, run_server  # noqa: E402
+from bot.config import config  # noqa: E402
+from bot.database import Database  # noqa: E402
+from bot.dispatcher import create_dispatcher  # noqa: E402
+from bot.handlers import start  # noqa: E402
+from bot.utils import AssetRegistry, BroadcastEngine, JobScheduler  # noqa: E402
+from bot.utils.metrics import instrument_database  # noqa: E402
+
+# Синтетические пользователи, не пересекаются с ADMIN_ID
+FIRST_USER_ID = 1_000_000
+
+
+def make_updates(users: int) -> List[Dict[str, Any]]:
+    """Обновления воронки: все /start, затем все нажатия кнопки, затем сообщения"""
+    updates = []
+    now = int(time.time())
+    update_ids = iter(range(1, users * 3 + 1))
+
+    def user(user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}",
+                "username": f"user{user_id}"}
+
+    def message(user_id: int, text: str) -> Dict[str, Any]:
+        return {"message_id": 1, "date": now, "text": text,
+                "chat": {"id": user_id, "type": "private"}, "from": user(user_id)}
+
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+    for user_id in user_ids:
+        updates.append({
+            "update_id": next(update_ids),
+            "message": dict(message(user_id, "/start"),
+                            entities=[{"type": "bot_command", "offset": 0, "length": 6}]),
+        })
+    for user_id in user_ids:
+        bot_message = message(user_id, "Подпишись на канал")
+        bot_message["from"] = {"id": BOT_ID, "is_bot": True, "first_name": "Bot"}
+        updates.append({
+            "update_id": next(update_ids),
+            "callback_query": {
+                "id": str(user_id), "from": user(user_id), "chat_instance": "1",
+                "message": bot_message, "data": "check_subscription",
+            },
+        })
+    for user_id in user_ids:
+        updates.append({
+            "update_id": next(update_ids),
+            "message": message(user_id, "Здравствуйте! Хочу обсудить проект"),
+        })
+    return updates
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса (ru_maxrss в Linux - килобайты)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def wait_server(http: aiohttp.ClientSession, url: str, timeout: float = 10):
+    """Ожидание, пока сервер в дочернем процессе начнет принимать запросы"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with http.get(f"{url}/_stats"):
+                return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def wait_jobs(db: Database, timeout: float) -> bool:
+    """Ожидание, пока планировщик выполнит все задачи"""
+    deadline = time.monotonic() + timeout
+    while await db.count_pending_jobs():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+async def run(args, server_url: str) -> int:
+    started = time.monotonic()
+    http = aiohttp.ClientSession()
+    await wait_server(http, server_url)
+    bot = make_bot(server_url)
+
+    tmp = tempfile.TemporaryDirectory()
+    db = Database(
+        os.path.join(tmp.name, "loadtest.db"),
+        read_pool_size=config.db_read_pool_size,
+        write_behind=args.write_behind,
+        flush_interval=config.db_flush_interval,
+        flush_max_ops=config.db_flush_max_ops,
+        user_cache_size=config.user_cache_size,
+        route_ttl=config.reply_route_ttl_days * 24 * 3600,
+        fsm_ttl=config.fsm_state_ttl_hours * 3600,
+    )
+    instrument_database(db)
+    await db.connect()
+
+    assets = AssetRegistry(db, config.static_dir)
+    scheduler = JobScheduler(bot, db, rate=config.job_rate)
+    start.register_jobs(scheduler, db, assets)
+    broadcaster = BroadcastEngine(bot, db)
+    if args.scheduler:
+        start.DELAY_BONUS = args.bonus_delay
+        start.DELAY_CONTACT = args.contact_delay
+        await assets.load()
+        await scheduler.start()
+
+    updates = make_updates(args.users)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    processed = 0
+    all_done = asyncio.Event()
+
+    async def measure(handler, event, data):
+        """Замер полного пути обновления, включая middleware бота"""
+        nonlocal errors, processed
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            errors += 1
+            raise
+        finally:
+            latencies[event.event_type].append(time.perf_counter() - started)
+            processed += 1
+            if processed == len(updates):
+                all_done.set()
+
+    services = {"db": db, "scheduler": scheduler, "broadcaster": broadcaster}
+    dp = create_dispatcher(bot, db, services, started, outer=(measure,))
+    started_at = time.perf_counter()
+
+    if args.mode == "polling":
+        async with http.post(f"{server_url}/_push", json=updates):
+            pass
+        polling = asyncio.create_task(
+            dp.start_polling(bot, handle_signals=False, polling_timeout=1)
+        )
+        await all_done.wait()
+        elapsed = time.perf_counter() - started_at
+        await dp.stop_polling()
+        await polling
+    else:
+        # Как вебхук: обновления обрабатываются параллельно, не больше concurrency
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def feed(raw: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    await dp.feed_raw_update(bot, raw)
+                except Exception:
+                    pass
+
+        await asyncio.gather(*(feed(raw) for raw in updates))
+        elapsed = time.perf_counter() - started_at
+
+    jobs_elapsed = None
+    if args.scheduler:
+        if await wait_jobs(db, args.jobs_timeout):
+            jobs_elapsed = time.perf_counter() - started_at
+        await scheduler.stop()
+
+    await db.disconnect()
+    await bot.session.close()
+    tmp.cleanup()
+
+    async with http.get(f"{server_url}/_stats") as response:
+        server_stats = await response.json()
+    await http.close()
+    calls = sorted(server_stats["calls"].items(), key=lambda item: -item[1])
+    injected = sorted(server_stats["errors"].items(), key=lambda item: -item[1])
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    print(f"\nРежим: {args.mode}, пользователей: {args.users}, обновлений: {len(updates)}")
+    print(f"Время: {elapsed:.2f} сек, {len(updates) / elapsed:.0f} обновлений/сек, ошибок: {errors}")
+    for kind, values in sorted(latencies.items()) + [("всего", all_latencies)]:
+        print(
+            f"  {kind:15} p50 {percentile(values, 50):8.2f} мс  "
+            f"p99 {percentile(values, 99):8.2f} мс  ({len(values)})"
+        )
+    if args.scheduler:
+        if jobs_elapsed is None:
+            print(f"Отложенные задачи не выполнены за {args.jobs_timeout:.0f} сек")
+        else:
+            print(f"Отложенные задачи выполнены через {jobs_elapsed:.2f} сек от начала")
+    print(f"Пиковый RSS: {peak_rss_mb():.1f} МБ")
+    print("Запросы к Bot API: " + ", ".join(f"{method} {count}" for method, count in calls))
+    if injected:
+        print("Внедренные ошибки: " + ", ".join(f"{key} {count}" for key, count in injected))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--mode", choices=("feed", "polling"), default="feed",
+                        help="feed - напрямую в диспетчер (как вебхук), polling - через getUpdates")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0)
+    parser.add_argument("--rate-5xx", type=float, default=0)
+    parser.add_argument("--subscribed", type=float, default=0.9,
+                        help="доля пользователей, подписанных на канал")
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--scheduler", action="store_true",
+                        help="запустить планировщик и дождаться отправки бонуса и контактов")
+    parser.add_argument("--bonus-delay", type=float, default=start.DELAY_BONUS,
+                        help="задержка бонуса, сек (с --scheduler)")
+    parser.add_argument("--contact-delay", type=float, default=start.DELAY_CONTACT,
+                        help="задержка контактов после бонуса, сек (с --scheduler)")
+    parser.add_argument("--jobs-timeout", type=float, default=600,
+                        help="сколько ждать выполнения отложенных задач, сек")
+    parser.add_argument("--verbose", action="store_true", help="логи бота уровня INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    server = multiprocessing.Process(
+        target=run_server,
+        kwargs=dict(
+            port=args.port,
+            latency=args.latency_ms / 1000,
+            jitter=args.jitter_ms / 1000,
+            rate_429=args.rate_429,
+            rate_5xx=args.rate_5xx,
+            subscribed_ratio=args.subscribed,
+        ),
+        daemon=True,
+    )
+    server.start()
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{args.port}"))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
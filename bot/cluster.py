@@ -0,0 +1,550 @@
+"""
+Кластерный режим: несколько процессов-обработчиков, разделенных по user_id
+
+Фронт (главный процесс) получает обновления (polling или вебхук) и
+передает каждое воркеру номер user_id % N через Unix-сокет. Обновления
+одного пользователя всегда попадают в один процесс и обрабатываются
+по порядку, разные пользователи - параллельно на всех ядрах.
+
+Фронт - единственный писатель SQLite. Воркеры читают БД своими
+соединениями, а записи отправляют фронту (Database с remote_writer),
+где они попадают в общую очередь группового коммита. Отложенные задачи
+каждый воркер берет только своего шарда, рассылки продолжает воркер
+администратора.
+
+Кадры в сокете: длина (4 байта) + pickle. Фронт делает pickle.loads
+кадров воркеров, поэтому сокет доступен только владельцу процесса:
+он лежит в личном каталоге (0700) и сам имеет права 0600.
+    фронт -> воркер: ("update", dict), ("result", id, ok, значение), ("stop",)
+    воркер -> фронт: ("hello", номер), ("ready",),
+                     ("write", id, sql, params, fetch), ("call", id, метод, args, kwargs)
+
+Воркеры фронт запускает сам:
+    python -m bot.cluster --index 0 --count 4 --socket /tmp/tgbot-cluster-XXXX/cluster.sock
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Set
+
+# Начало отсчета времени запуска воркера (до импорта aiogram и остального кода)
+STARTED_AT = time.monotonic()
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+
+from bot.config import config
+from bot.database import Database
+from bot.dispatcher import create_dispatcher
+from bot.handlers import main_router
+from bot.handlers.start import register_jobs
+from bot.log import setup_logging
+from bot.utils import (
+    JobScheduler,
+    AssetRegistry,
+    BroadcastEngine,
+    MetricsServer,
+    RetentionService,
+)
+from bot.utils.metrics import STARTUP_DURATION, instrument_database
+from bot.webhook import run_webhook
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+def _create_bot() -> Bot:
+    session = None
+    if config.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
+    return Bot(
+        token=config.bot_token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+def _pack(frame: tuple) -> bytes:
+    data = pickle.dumps(frame, pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(data)) + data
+
+
+def _pack_result(request_id: int, ok: bool, value: Any) -> bytes:
+    try:
+        return _pack(("result", request_id, ok, value))
+    except Exception:
+        # Исключение или результат, который не сериализуется
+        return _pack(("result", request_id, False, RuntimeError(repr(value))))
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def update_user_id(update: Dict[str, Any]) -> int:
+    """Пользователь, от которого пришло обновление (0, если его нет)"""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        # chat_member: шард участника, а не того, кто изменил его статус
+        member = event.get("new_chat_member") or {}
+        user = member.get("user") or event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+class WriterClient:
+    """Запись в БД через фронт (remote_writer для Database воркера)"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._closed: Optional[Exception] = None
+
+    async def write(self, sql: str, params: tuple = (), fetch: bool = False) -> Any:
+        return await self._request("write", sql, params, fetch)
+
+    async def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._request("call", method, args, kwargs)
+
+    async def _request(self, kind: str, *payload: Any) -> Any:
+        if self._closed is not None:
+            raise self._closed
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(_pack((kind, request_id, *payload)))
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    def resolve(self, request_id: int, ok: bool, value: Any):
+        """Ответ фронта на запрос request_id"""
+        future = self._pending.get(request_id)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def close(self, error: Exception):
+        """Соединение с фронтом потеряно: ожидающие и новые запросы падают"""
+        self._closed = error
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class ClusterFront:
+    """Фронт: запуск воркеров, раздача обновлений и запись в БД"""
+
+    def __init__(self, bot: Bot, db: Database, workers: int, socket_path: str):
+        self.bot = bot
+        self.db = db
+        self.workers = workers
+        self.socket_path = socket_path
+
+        self._connections: List[Optional[asyncio.StreamWriter]] = [None] * workers
+        self._ready = [asyncio.Event() for _ in range(workers)]
+        self._processes: List[asyncio.subprocess.Process] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Ссылки на задачи обслуживания записей, чтобы их не собрал GC
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def is_healthy(self) -> bool:
+        """Все воркеры запущены и на связи (для /healthz)"""
+        running = all(process.returncode is None for process in self._processes)
+        ready = all(event.is_set() for event in self._ready)
+        return bool(self._processes) and running and ready
+
+    async def start(self, timeout: float = 60):
+        """Запуск воркеров и ожидание их готовности"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+
+        for index in range(self.workers):
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "bot.cluster",
+                "--index", str(index),
+                "--count", str(self.workers),
+                "--socket", self.socket_path,
+            )
+            self._processes.append(process)
+
+        ready = asyncio.ensure_future(asyncio.gather(*(event.wait() for event in self._ready)))
+        exited = asyncio.ensure_future(self.wait_worker_exit())
+        done, _ = await asyncio.wait(
+            [ready, exited], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        ready.cancel()
+        exited.cancel()
+        if ready not in done:
+            raise RuntimeError("Воркеры кластера не запустились")
+        logger.info(f"Кластер запущен, воркеров: {self.workers}")
+
+    async def wait_worker_exit(self) -> int:
+        """Ожидание завершения любого воркера. Возвращает его номер"""
+        waits = {
+            asyncio.ensure_future(process.wait()): index
+            for index, process in enumerate(self._processes)
+        }
+        try:
+            done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            return waits[done.pop()]
+        finally:
+            for wait in waits:
+                wait.cancel()
+
+    async def stop(self, timeout: float = 30):
+        """Остановка: воркеры дообрабатывают обновления и записи и выходят"""
+        for connection in self._connections:
+            if connection is not None and not connection.is_closing():
+                connection.write(_pack(("stop",)))
+
+        for index, process in enumerate(self._processes):
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Воркер {index} не остановился за {timeout} сек, завершаем")
+                process.kill()
+                await process.wait()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def route(self, update: Dict[str, Any]):
+        """Передача обновления воркеру его пользователя"""
+        connection = self._connections[update_user_id(update) % self.workers]
+        connection.write(_pack(("update", update)))
+        await connection.drain()
+
+    async def poll(self, allowed_updates: List[str], timeout: int = 30):
+        """
+        Long polling getUpdates
+
+        Обновления не разбираются в модели aiogram: фронту нужен только
+        user_id, остальное делает воркер.
+        """
+        await self.bot.delete_webhook(drop_pending_updates=True)
+        http = await self.bot.session.create_session()
+        url = self.bot.session.api.api_url(self.bot.token, "getUpdates")
+        params: Dict[str, Any] = {"timeout": timeout, "allowed_updates": allowed_updates}
+        request_timeout = aiohttp.ClientTimeout(total=timeout + 10)
+        backoff = 1
+
+        logger.info("Фронт кластера: polling запущен")
+        while True:
+            try:
+                async with http.post(url, json=params, timeout=request_timeout) as response:
+                    data = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Ошибка getUpdates: {e}, повтор через {backoff} сек")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            if not data.get("ok"):
+                retry_after = (data.get("parameters") or {}).get("retry_after", backoff)
+                logger.warning(f"getUpdates: {data.get('description')}, повтор через {retry_after} сек")
+                await asyncio.sleep(retry_after)
+                continue
+
+            backoff = 1
+            for update in data["result"]:
+                params["offset"] = update["update_id"] + 1
+                await self.route(update)
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Соединение воркера: готовность и запросы на запись"""
+        index = None
+        try:
+            _, index = await _read_frame(reader)
+            self._connections[index] = writer
+            while True:
+                frame = await _read_frame(reader)
+                if frame[0] == "ready":
+                    self._ready[index].set()
+                    continue
+                task = asyncio.create_task(self._serve(writer, frame))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except asyncio.IncompleteReadError:
+            # Воркер закрыл соединение
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка соединения с воркером {index}: {e}")
+        finally:
+            writer.close()
+
+    async def _serve(self, writer: asyncio.StreamWriter, frame: tuple):
+        kind, request_id, *payload = frame
+        try:
+            if kind == "write":
+                value = await self.db.serve_write(*payload)
+            else:
+                value = await self.db.serve_call(*payload)
+            ok = True
+        except Exception as e:
+            value, ok = e, False
+
+        if not writer.is_closing():
+            writer.write(_pack_result(request_id, ok, value))
+            await writer.drain()
+
+
+async def run_cluster(workers: int):
+    """Фронт кластера: работает до SIGINT/SIGTERM или падения воркера"""
+    bot = _create_bot()
+
+    # Диспетчер фронта нужен только для списка используемых типов обновлений
+    dp = Dispatcher()
+    dp.include_router(main_router)
+
+    db = Database(
+        config.database_path,
+        read_pool_size=1,
+        write_behind=config.db_write_behind,
+        flush_interval=config.db_flush_interval,
+        flush_max_ops=config.db_flush_max_ops,
+        user_cache_size=0,
+        route_cache_size=0,
+        route_ttl=config.reply_route_ttl_days * 24 * 3600,
+        fsm_ttl=config.fsm_state_ttl_hours * 3600,
+    )
+    instrument_database(db)
+
+    retention = RetentionService(
+        db,
+        retention_days=config.messages_retention_days,
+        batch_size=config.retention_batch_size,
+    )
+
+    # mkdtemp создает каталог с правами 0700: чужие процессы не подключатся к сокету
+    socket_dir = tempfile.mkdtemp(prefix="tgbot-cluster-")
+    front = ClusterFront(bot, db, workers, os.path.join(socket_dir, "cluster.sock"))
+
+    metrics_server = MetricsServer(
+        config.metrics_host,
+        config.metrics_port,
+        checks={"database": db.ping, "workers": front.is_healthy},
+    )
+
+    serving: Optional[asyncio.Task] = None
+    await db.connect()
+    try:
+        if config.metrics_port:
+            await metrics_server.start()
+        await front.start()
+        await retention.start()
+
+        bot_info = await bot.get_me()
+        logger.info(f"✅ Бот запущен: @{bot_info.username} (кластер, воркеров: {workers})")
+
+        if config.bot_mode == "webhook":
+            serving = asyncio.create_task(run_webhook(bot, dp, route=front.route))
+        else:
+            serving = asyncio.create_task(front.poll(dp.resolve_used_update_types()))
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, serving.cancel)
+                except NotImplementedError:
+                    pass
+
+        exited = asyncio.create_task(front.wait_worker_exit())
+        done, _ = await asyncio.wait([serving, exited], return_when=asyncio.FIRST_COMPLETED)
+        if exited in done:
+            raise RuntimeError(f"Воркер {exited.result()} кластера завершился")
+        exited.cancel()
+        if not serving.cancelled():
+            serving.result()
+    finally:
+        logger.info("🛑 Кластер останавливается...")
+        if serving is not None and not serving.done():
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+        await front.stop()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+        await retention.stop()
+        await db.disconnect()
+        await metrics_server.stop()
+        await bot.session.close()
+        logger.info("✅ Кластер остановлен")
+
+
+async def run_worker(index: int, count: int, socket_path: str, started_at: Optional[float] = None):
+    """Воркер кластера: обработка обновлений своего шарда пользователей"""
+    started_at = time.monotonic() if started_at is None else started_at
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(_pack(("hello", index)))
+    remote = WriterClient(writer)
+
+    bot = _create_bot()
+    db = Database(
+        config.database_path,
+        read_pool_size=max(config.db_read_pool_size, 1),
+        user_cache_size=config.user_cache_size,
+        route_ttl=config.reply_route_ttl_days * 24 * 3600,
+        fsm_ttl=config.fsm_state_ttl_hours * 3600,
+        remote_writer=remote,
+    )
+    instrument_database(db)
+
+    assets = AssetRegistry(db, config.static_dir)
+    # Лимит отправок делится между воркерами
+    scheduler = JobScheduler(bot, db, rate=config.job_rate / count, shard=(index, count))
+    register_jobs(scheduler, db, assets)
+    broadcaster = BroadcastEngine(
+        bot,
+        db,
+        rate=config.broadcast_rate,
+        concurrency=config.broadcast_concurrency,
+    )
+
+    services = {"db": db, "scheduler": scheduler, "broadcaster": broadcaster}
+    dp = create_dispatcher(bot, db, services, started_at)
+
+    # Последнее обновление каждого пользователя: следующее ждет его завершения
+    tails: Dict[int, asyncio.Task] = {}
+    stopping = asyncio.Event()
+
+    async def process(update: Dict[str, Any], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    def submit(update: Dict[str, Any]):
+        user_id = update_user_id(update)
+        task = asyncio.create_task(process(update, tails.get(user_id)))
+        tails[user_id] = task
+
+        def forget(_):
+            if tails.get(user_id) is task:
+                del tails[user_id]
+
+        task.add_done_callback(forget)
+
+    async def read_frames():
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if frame[0] == "result":
+                    remote.resolve(*frame[1:])
+                elif frame[0] == "update":
+                    submit(frame[1])
+                elif frame[0] == "stop":
+                    stopping.set()
+        except asyncio.IncompleteReadError:
+            if not stopping.is_set():
+                logger.error("Фронт кластера закрыл соединение")
+        finally:
+            remote.close(ConnectionError("Нет соединения с фронтом кластера"))
+            stopping.set()
+
+    reading = asyncio.create_task(read_frames())
+
+    async def is_scheduler_running() -> bool:
+        return scheduler.is_running
+
+    # Метрики воркера - на следующих за фронтом портах
+    metrics_server = MetricsServer(
+        config.metrics_host,
+        config.metrics_port + 1 + index,
+        checks={"scheduler": is_scheduler_running},
+    )
+
+    await db.connect()
+    await assets.load()
+    await scheduler.start()
+    # Прерванные рассылки продолжает один воркер - тот, что обслуживает администратора
+    if config.admin_id % count == index:
+        await broadcaster.resume()
+    if config.metrics_port:
+        await metrics_server.start()
+
+    writer.write(_pack(("ready",)))
+    STARTUP_DURATION.set(time.monotonic() - started_at)
+    logger.info(f"Воркер {index} из {count} готов")
+
+    await stopping.wait()
+
+    # Дообрабатываем принятые обновления, записи еще уходят фронту
+    if tails:
+        await asyncio.wait(list(tails.values()))
+    await scheduler.stop()
+    await broadcaster.stop()
+    await db.disconnect()
+    await metrics_server.stop()
+    await bot.session.close()
+
+    reading.cancel()
+    await asyncio.gather(reading, return_exceptions=True)
+    writer.close()
+    logger.info(f"Воркер {index} остановлен")
+
+
+def _worker_log_file(index: int) -> Optional[str]:
+    """bot.log -> bot.worker0.log (ротация файла из нескольких процессов небезопасна)"""
+    if not config.log_file:
+        return None
+    root, ext = os.path.splitext(config.log_file)
+    return f"{root}.worker{index}{ext}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер кластера (запускается фронтом)")
+    parser.add_argument("--index", type=int, required=True)
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--socket", required=True)
+    args = parser.parse_args()
+
+    # Ctrl+C получает вся группа процессов, а воркеры останавливает фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    setup_logging(
+        level=config.log_level,
+        log_file=_worker_log_file(args.index),
+        max_bytes=config.log_max_bytes,
+        backup_count=config.log_backup_count,
+        json_format=config.log_json,
+        rate_limit=config.log_rate_limit,
+    )
+    asyncio.run(run_worker(args.index, args.count, args.socket, STARTED_AT))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 import os
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 # Базовая директория проекта (корень)
@@ -22,13 +23,67 @@ class Config:
     admin_id: int
     channel_id: str  # Может быть @username или -100123456789
     channel_link: str
+    telegram_api_url: Optional[str]  # свой Bot API сервер вместо api.telegram.org
 
     # Контент
     article_link: str
     pdf_file_path: str
+    static_dir: str
 
     # База данных
     database_path: str
+    db_read_pool_size: int  # соединения только для чтения (WAL)
+    db_write_behind: bool  # групповой коммит записей
+    db_flush_interval: float  # секунды
+    db_flush_max_ops: int
+    user_cache_size: int  # профилей пользователей в памяти
+    messages_retention_days: float  # старше - в сжатый архив (0 - не архивировать)
+    retention_batch_size: int
+    reply_route_ttl_days: float  # сколько помнить, кому отвечать на пересланное админу
+    fsm_state_ttl_hours: float  # состояние FSM без изменений дольше - брошено
+    fsm_cache_size: int
+
+    # Кэш проверки подписки (секунды)
+    subscription_cache_size: int
+    subscription_cache_ttl: float
+    subscription_cache_negative_ttl: float
+    channel_mirror_ttl_hours: float  # сколько верить зеркалу участников канала
+
+    # Рассылки
+    broadcast_rate: float  # сообщений в секунду (лимит Telegram ~30)
+    broadcast_concurrency: int
+    job_rate: float  # сообщений в секунду из отложенных задач (бонус, контакты)
+
+    # Режим получения обновлений: polling или webhook
+    bot_mode: str
+    webhook_url: Optional[str]  # публичный адрес, например https://bot.example.com
+    webhook_path: str
+    webhook_secret: Optional[str]
+    webapp_host: str
+    webapp_port: int
+    webhook_max_connections: int
+    max_in_flight_updates: int
+
+    # Ограничение частоты обновлений от пользователя (token bucket)
+    throttle_rate: float  # обновлений в секунду (0 - без ограничения)
+    throttle_burst: float
+    throttle_max_delay: float  # секунды; дольше ждать - обновление отбрасывается
+    throttle_slots: int  # размер таблицы корзин
+
+    # Кластер: число процессов-обработчиков (0 - один процесс)
+    cluster_workers: int
+
+    # Метрики Prometheus и проверка готовности (/metrics, /healthz)
+    metrics_host: str
+    metrics_port: int  # 0 - сервер метрик выключен
+
+    # Логирование
+    log_level: str
+    log_file: Optional[str]  # пусто - только stdout
+    log_max_bytes: int  # размер файла до ротации
+    log_backup_count: int
+    log_json: bool
+    log_rate_limit: int  # записей в минуту с одного места (проверка подписки, БД)
 
     # Сообщения
     welcome_message: str
@@ -57,25 +112,76 @@ class Config:
         if not channel_id:
             raise ValueError("CHANNEL_ID не установлен в .env файле!")
 
+        bot_mode = os.getenv("BOT_MODE", "polling").lower()
+        if bot_mode not in ("polling", "webhook"):
+            raise ValueError("BOT_MODE должен быть polling или webhook!")
+
+        webhook_url = os.getenv("WEBHOOK_URL")
+        if bot_mode == "webhook" and not webhook_url:
+            raise ValueError("WEBHOOK_URL не установлен в .env файле (BOT_MODE=webhook)!")
+
         # Пути к файлам
         # В Docker: /app/static/... , локально: от корня проекта
         if os.path.exists("/app/static"):
             # Docker
-            pdf_path = "/app/static/bonus.pdf"
+            static_dir = "/app/static"
             db_path = "/app/data/bot.db"
         else:
             # Локальный запуск
-            pdf_path = str(BASE_DIR / "static" / "bonus.pdf")
+            static_dir = str(BASE_DIR / "static")
             db_path = str(BASE_DIR / "data" / "bot.db")
+        pdf_path = os.path.join(static_dir, "bonus.pdf")
 
         return cls(
             bot_token=bot_token,
             admin_id=admin_id,
             channel_id=channel_id,
             channel_link=os.getenv("CHANNEL_LINK", "https://t.me/your_channel"),
+            telegram_api_url=os.getenv("TELEGRAM_API_URL") or None,
             article_link=os.getenv("ARTICLE_LINK", "https://example.com/article"),
             pdf_file_path=pdf_path,
+            static_dir=static_dir,
             database_path=db_path,
+            db_read_pool_size=int(os.getenv("DB_READ_POOL_SIZE", "4")),
+            db_write_behind=os.getenv("DB_WRITE_BEHIND", "0").lower() in ("1", "true", "yes"),
+            db_flush_interval=int(os.getenv("DB_FLUSH_INTERVAL_MS", "5")) / 1000,
+            db_flush_max_ops=int(os.getenv("DB_FLUSH_MAX_OPS", "200")),
+            user_cache_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+            messages_retention_days=float(os.getenv("MESSAGES_RETENTION_DAYS", "90")),
+            retention_batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "500")),
+            reply_route_ttl_days=float(os.getenv("REPLY_ROUTE_TTL_DAYS", "30")),
+            fsm_state_ttl_hours=float(os.getenv("FSM_STATE_TTL_HOURS", "24")),
+            fsm_cache_size=int(os.getenv("FSM_CACHE_SIZE", "10000")),
+            subscription_cache_size=int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000")),
+            subscription_cache_ttl=float(os.getenv("SUBSCRIPTION_CACHE_TTL", "300")),
+            subscription_cache_negative_ttl=float(
+                os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL", "5")
+            ),
+            channel_mirror_ttl_hours=float(os.getenv("CHANNEL_MIRROR_TTL_HOURS", "24")),
+            broadcast_rate=float(os.getenv("BROADCAST_RATE", "25")),
+            broadcast_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "10")),
+            job_rate=float(os.getenv("JOB_RATE", "10")),
+            bot_mode=bot_mode,
+            webhook_url=webhook_url,
+            webhook_path=os.getenv("WEBHOOK_PATH", "/webhook"),
+            webhook_secret=os.getenv("WEBHOOK_SECRET"),
+            webapp_host=os.getenv("WEBAPP_HOST", "0.0.0.0"),
+            webapp_port=int(os.getenv("WEBAPP_PORT", "8080")),
+            webhook_max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+            max_in_flight_updates=int(os.getenv("MAX_IN_FLIGHT_UPDATES", "100")),
+            throttle_rate=float(os.getenv("THROTTLE_RATE", "1")),
+            throttle_burst=float(os.getenv("THROTTLE_BURST", "5")),
+            throttle_max_delay=float(os.getenv("THROTTLE_MAX_DELAY", "1")),
+            throttle_slots=int(os.getenv("THROTTLE_SLOTS", "65536")),
+            cluster_workers=int(os.getenv("CLUSTER_WORKERS", "0")),
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            metrics_port=int(os.getenv("METRICS_PORT", "9100")),
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+            log_file=os.getenv("LOG_FILE", "bot.log") or None,
+            log_max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            log_backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            log_json=os.getenv("LOG_JSON", "0").lower() in ("1", "true", "yes"),
+            log_rate_limit=int(os.getenv("LOG_RATE_LIMIT", "30")),
             welcome_message=os.getenv(
                 "WELCOME_MESSAGE",
                 "Привет! 👋\n\nДля получения полезной статьи подпишись на мой канал."
@@ -92,11 +198,5 @@ class Config:
 
 
 # Глобальный экземпляр конфигурации
+# (пути и наличие файлов пишутся в лог при запуске бота, а не при импорте)
 config = Config.from_env()
-
-# Отладка путей при загрузке
-import logging
-_logger = logging.getLogger(__name__)
-_logger.info(f"BASE_DIR: {BASE_DIR}")
-_logger.info(f"PDF путь: {config.pdf_file_path}")
-_logger.info(f"PDF существует: {os.path.exists(config.pdf_file_path)}")
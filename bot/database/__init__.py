@@ -2,5 +2,8 @@
 Модуль для работы с базой данных
 """
 from .db import Database
+from .records import UserRecord
+from .segments import Segment
+from .storage import SQLiteStorage
 
-__all__ = ["Database"]
+__all__ = ["Database", "UserRecord", "Segment", "SQLiteStorage"]
@@ -1,49 +1,429 @@
 """
 Класс для работы с SQLite базой данных
 """
+import asyncio
 import aiosqlite
+import functools
+import json
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any, List
-from .models import CREATE_USERS_TABLE, CREATE_MESSAGES_TABLE, CREATE_INDEXES
+import time
+import zlib
+from contextlib import asynccontextmanager
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Sequence
+from bot.cache import TTLCache
+from .records import UserRecord
+from .segments import COUNTER_SEGMENTS, Segment
+from .models import STATS_COUNTERS, SCHEMA_MIGRATIONS, SCHEMA_VERSION
 
 logger = logging.getLogger(__name__)
 
 
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    """Сжатие текста для архива (SQL функция zcompress)"""
+    return zlib.compress(text.encode("utf-8")) if text is not None else None
+
+
+def _decompress(data: Optional[bytes]) -> Optional[str]:
+    """Распаковка текста из архива (SQL функция zdecompress)"""
+    return zlib.decompress(data).decode("utf-8") if data is not None else None
+
+
+# Методы, которые в кластерном режиме целиком выполняет процесс-писатель
+WRITER_METHODS = set()
+
+
+def _on_writer(method):
+    """
+    Метод с транзакцией на пишущем соединении
+
+    У Database с remote_writer такого соединения нет: вызов
+    передается процессу-писателю и выполняется там.
+    """
+    WRITER_METHODS.add(method.__name__)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if self.remote_writer is not None:
+            return await self.remote_writer.call(method.__name__, *args, **kwargs)
+        return await method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class Database:
-    """Класс для работы с базой данных"""
+    """
+    Класс для работы с базой данных
 
-    def __init__(self, db_path: str):
+    Соединения: одно пишущее и пул из read_pool_size соединений только
+    для чтения. В режиме WAL читатели не ждут пишущего и наоборот.
+
+    При write_behind=True одиночные записи не коммитятся по отдельности:
+    они копятся в очереди и сбрасываются одной транзакцией раз в
+    flush_interval секунд или по набору flush_max_ops операций.
+    Вызывающий код по-прежнему ждет, пока его запись не будет закоммичена.
+
+    Профили пользователей кэшируются в LRU (user_cache_size записей).
+    Методы записи в users обновляют закэшированную запись, поэтому
+    повторные get_user активных пользователей не обращаются к SQLite.
+
+    Маршруты ответов администратора (сообщение в чате админа -> user_id)
+    тоже держатся в LRU (route_cache_size записей) перед таблицей.
+
+    С remote_writer (воркер кластера) пишущего соединения нет: БД читается
+    своим пулом, а записи и транзакции выполняет процесс-писатель
+    (remote_writer.write / remote_writer.call).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_pool_size: int = 4,
+        wal: bool = True,
+        write_behind: bool = False,
+        flush_interval: float = 0.005,
+        flush_max_ops: int = 200,
+        user_cache_size: int = 10000,
+        route_cache_size: int = 10000,
+        route_ttl: float = 30 * 24 * 3600,
+        fsm_ttl: float = 24 * 3600,
+        remote_writer: Optional[Any] = None,
+    ):
         self.db_path = db_path
         self.connection: Optional[aiosqlite.Connection] = None
 
+        # Для базы в памяти отдельные читатели невозможны
+        self.read_pool_size = 0 if db_path == ":memory:" else read_pool_size
+        self.wal = wal
+        self._readers: List[aiosqlite.Connection] = []
+        self._read_pool: Optional[asyncio.Queue] = None
+
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_max_ops = flush_max_ops
+
+        # Транзакции на общем соединении не должны перемешиваться
+        self._write_lock = asyncio.Lock()
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Кэш профилей: user_id -> UserRecord
+        self.user_cache = TTLCache(maxsize=user_cache_size) if user_cache_size else None
+        # Растет при каждой записи в users: чтение, пересекшееся с записью,
+        # не кладет в кэш возможно устаревшую строку
+        self._users_version = 0
+
+        # Маршруты ответов: (admin_chat_id, message_id) -> user_id
+        self.route_ttl = route_ttl
+        self.route_cache = (
+            TTLCache(maxsize=route_cache_size, ttl=route_ttl) if route_cache_size else None
+        )
+
+        # Состояния FSM без изменений дольше fsm_ttl считаются брошенными
+        self.fsm_ttl = fsm_ttl
+
+        self.remote_writer = remote_writer
+        if remote_writer is not None and not self.read_pool_size:
+            raise ValueError("Для remote_writer нужен файл БД и read_pool_size > 0")
+
     async def connect(self):
         """Подключение к базе данных"""
-        self.connection = await aiosqlite.connect(self.db_path)
-        self.connection.row_factory = aiosqlite.Row
-        await self._create_tables()
-        logger.info(f"База данных подключена: {self.db_path}")
+        # Таблицы создает процесс-писатель, воркеру нужны только читатели
+        if self.remote_writer is None:
+            self.connection = await aiosqlite.connect(self.db_path)
+            self.connection.row_factory = aiosqlite.Row
+            # auto_vacuum задается в пустой БД - до WAL и создания таблиц
+            await self._set_incremental_vacuum()
+            await self._apply_pragmas(self.connection)
+            await self._register_functions(self.connection)
+            await self._migrate()
+
+        if self.read_pool_size:
+            self._read_pool = asyncio.Queue()
+            reader_uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            # Соединения открываются параллельно: у каждого свой поток aiosqlite
+            self._readers.extend(await asyncio.gather(
+                *(self._open_reader(reader_uri) for _ in range(self.read_pool_size))
+            ))
+            for reader in self._readers:
+                self._read_pool.put_nowait(reader)
+
+        if self.write_behind:
+            self._write_queue = asyncio.Queue()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+        logger.info("База данных подключена: %s", self.db_path)
+
+    async def _open_reader(self, uri: str) -> aiosqlite.Connection:
+        """Соединение только для чтения"""
+        reader = await aiosqlite.connect(uri, uri=True)
+        reader.row_factory = aiosqlite.Row
+        await self._apply_pragmas(reader, readonly=True)
+        await self._register_functions(reader)
+        return reader
 
     async def disconnect(self):
         """Отключение от базы данных"""
+        if self._flush_task:
+            # Дописываем все, что осталось в очереди
+            self._write_queue.put_nowait(None)
+            await self._flush_task
+            self._flush_task = None
+            self._write_queue = None
+
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._read_pool = None
+
         if self.connection:
             await self.connection.close()
             logger.info("База данных отключена")
 
-    async def _create_tables(self):
-        """Создание таблиц, если их нет"""
-        async with self.connection.cursor() as cursor:
-            await cursor.execute(CREATE_USERS_TABLE)
-            await cursor.execute(CREATE_MESSAGES_TABLE)
+    async def ping(self) -> bool:
+        """Проверка, что база данных отвечает (для /healthz)"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute("SELECT 1")
+                return await cursor.fetchone() is not None
+        except Exception as e:
+            logger.warning("База данных не отвечает: %s", e)
+            return False
+
+    async def _apply_pragmas(self, connection: aiosqlite.Connection, readonly: bool = False):
+        """Настройки SQLite для соединения"""
+        if not readonly:
+            if self.wal:
+                await connection.execute("PRAGMA journal_mode = WAL")
+                # В WAL режим NORMAL не теряет целостность, fsync только на checkpoint
+                await connection.execute("PRAGMA synchronous = NORMAL")
+            else:
+                await connection.execute("PRAGMA journal_mode = DELETE")
+        else:
+            await connection.execute("PRAGMA query_only = 1")
+
+        await connection.execute("PRAGMA busy_timeout = 5000")
+        await connection.execute("PRAGMA cache_size = -16000")  # ~16 МБ
+        await connection.execute("PRAGMA mmap_size = 268435456")  # 256 МБ
+        await connection.execute("PRAGMA temp_store = MEMORY")
+
+    async def _register_functions(self, connection: aiosqlite.Connection):
+        """Функции сжатия текста для архива сообщений"""
+        await connection.create_function("zcompress", 1, _compress, deterministic=True)
+        await connection.create_function("zdecompress", 1, _decompress, deterministic=True)
+
+    async def _auto_vacuum_mode(self) -> int:
+        """Режим auto_vacuum (0 - NONE, 1 - FULL, 2 - INCREMENTAL)"""
+        async with self.connection.execute("PRAGMA auto_vacuum") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def _set_incremental_vacuum(self):
+        """
+        auto_vacuum = INCREMENTAL для новой БД
+
+        Существующую БД в этот режим переводит только полный VACUUM:
+        при запуске он не выполняется, это команда администратора
+        (enable_incremental_vacuum, /vacuum).
+        """
+        if await self._auto_vacuum_mode() == 2 or self.db_path == ":memory:":
+            return
+
+        async with self.connection.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'"
+        ) as cursor:
+            has_tables = (await cursor.fetchone())[0] > 0
+        if has_tables:
+            logger.warning(
+                "БД не в режиме auto_vacuum = INCREMENTAL: место после архивации "
+                "не возвращается файлу. Переведите ее командой /vacuum"
+            )
+            return
+        await self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    @_on_writer
+    async def enable_incremental_vacuum(self) -> bool:
+        """
+        Перевод существующей БД в auto_vacuum = INCREMENTAL полным VACUUM
 
-            for index_query in CREATE_INDEXES:
-                await cursor.execute(index_query)
+        Блокирует запись на все время пересборки файла - это действие
+        администратора, а не шаг запуска.
 
-            await self.connection.commit()
-        logger.info("Таблицы созданы/проверены")
+        Returns:
+            bool: True, если режим включен
+        """
+        async with self._write_lock:
+            if await self._auto_vacuum_mode() != 2:
+                logger.info("Перевод БД в режим auto_vacuum = INCREMENTAL (VACUUM)...")
+                await self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await self.connection.execute("VACUUM")
+            return await self._auto_vacuum_mode() == 2
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Курсор на свободном соединении для чтения"""
+        if self._read_pool is None:
+            async with self.connection.cursor() as cursor:
+                yield cursor
+            return
+
+        reader = await self._read_pool.get()
+        try:
+            async with reader.cursor() as cursor:
+                yield cursor
+        finally:
+            self._read_pool.put_nowait(reader)
+
+    # === Запись ===
+
+    async def _write(self, sql: str, params: Sequence = (), fetch: bool = False) -> Any:
+        """
+        Выполнение одного изменяющего запроса с коммитом
+
+        Args:
+            fetch: вернуть строки RETURNING вместо числа строк
+
+        Returns:
+            int: число затронутых строк (или список строк при fetch=True)
+        """
+        if self.remote_writer is not None:
+            return await self.remote_writer.write(sql, tuple(params), fetch)
+
+        if self._write_queue is None:
+            async with self._write_lock:
+                async with self.connection.cursor() as cursor:
+                    try:
+                        await cursor.execute(sql, params)
+                        # Строки RETURNING читаем до коммита
+                        result = await cursor.fetchall() if fetch else cursor.rowcount
+                        await self.connection.commit()
+                    except BaseException:
+                        await self.connection.rollback()
+                        raise
+                    return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((sql, params, fetch, future))
+        return await future
+
+    async def serve_write(self, sql: str, params: Sequence = (), fetch: bool = False) -> Any:
+        """Запись по запросу воркера кластера (строки RETURNING - словарями)"""
+        result = await self._write(sql, params, fetch)
+        return [dict(row) for row in result] if fetch else result
+
+    async def serve_call(self, method: str, args: Sequence = (), kwargs: Optional[Dict] = None) -> Any:
+        """Вызов метода-транзакции по запросу воркера кластера"""
+        if method not in WRITER_METHODS:
+            raise ValueError(f"Метод {method} нельзя вызвать удаленно")
+        return await getattr(self, method)(*args, **(kwargs or {}))
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Несколько запросов одной транзакцией (в обход очереди записей)"""
+        async with self._write_lock:
+            async with self.connection.cursor() as cursor:
+                try:
+                    yield cursor
+                    await self.connection.commit()
+                except BaseException:
+                    await self.connection.rollback()
+                    raise
+
+    async def _flush_loop(self):
+        """Фоновый сброс очереди записей группами"""
+        while True:
+            op = await self._write_queue.get()
+            if op is None:
+                return
+
+            # Даем набраться группе, если очередь еще не заполнена
+            if self._write_queue.qsize() < self.flush_max_ops - 1:
+                await asyncio.sleep(self.flush_interval)
+
+            batch = [op]
+            stop = False
+            while len(batch) < self.flush_max_ops and not self._write_queue.empty():
+                op = self._write_queue.get_nowait()
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            await self._flush_batch(batch)
+            if stop:
+                return
+
+    async def _flush_batch(self, batch: List[Tuple[str, Sequence, bool, asyncio.Future]]):
+        """Выполнение группы записей одной транзакцией"""
+        results = []
+        async with self._write_lock:
+            try:
+                async with self.connection.cursor() as cursor:
+                    for sql, params, fetch, future in batch:
+                        # Ошибка одного запроса откатывает только этот запрос
+                        try:
+                            await cursor.execute(sql, params)
+                            result = await cursor.fetchall() if fetch else cursor.rowcount
+                            results.append((future, result, None))
+                        except Exception as e:
+                            results.append((future, None, e))
+                    await self.connection.commit()
+            except Exception as e:
+                logger.error("Ошибка группового коммита (%s операций): %s", len(batch), e)
+                try:
+                    await self.connection.rollback()
+                except Exception:
+                    pass
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _migrate(self):
+        """
+        Приведение схемы к SCHEMA_VERSION по PRAGMA user_version
+
+        Если версия текущая, DDL не выполняется. Иначе недостающие
+        миграции применяются по порядку, каждая вместе с новым номером
+        версии - одной транзакцией.
+        """
+        async with self.connection.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        if version >= SCHEMA_VERSION:
+            logger.debug("Схема БД актуальна (версия %s)", version)
+            return
+
+        for number in sorted(n for n in SCHEMA_MIGRATIONS if n > version):
+            async with self._transaction() as cursor:
+                # DDL sqlite3 сам транзакцию не открывает
+                await cursor.execute("BEGIN")
+                for query in SCHEMA_MIGRATIONS[number]:
+                    await cursor.execute(query)
+                await cursor.execute(f"PRAGMA user_version = {number}")
+            logger.info("Схема БД: применена миграция %s", number)
+
+        # Счетчики статистики: при первом создании считаем по существующим данным
+        async with self.connection.execute("SELECT COUNT(*) FROM stats_counters") as cursor:
+            counters_exist = (await cursor.fetchone())[0] > 0
+        if not counters_exist:
+            await self.recount_stats()
 
     # === Работа с пользователями ===
 
+    def _cached_user(self, user_id: int) -> Optional[UserRecord]:
+        """Запись из кэша без учета в статистике попаданий"""
+        if self.user_cache is None:
+            return None
+        return self.user_cache.peek(user_id)
+
     async def add_user(
         self,
         user_id: int,
@@ -52,84 +432,155 @@ class Database:
         last_name: Optional[str] = None,
     ) -> bool:
         """Добавление нового пользователя"""
+        self._users_version += 1
         try:
-            async with self.connection.cursor() as cursor:
-                await cursor.execute(
-                    """
-                    INSERT INTO users (user_id, username, first_name, last_name)
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        username = excluded.username,
-                        first_name = excluded.first_name,
-                        last_name = excluded.last_name,
-                        last_active = CURRENT_TIMESTAMP
-                    """,
-                    (user_id, username, first_name, last_name),
-                )
-                await self.connection.commit()
-            logger.info(f"Пользователь {user_id} добавлен/обновлен")
+            await self._write(
+                """
+                INSERT INTO users (user_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    last_active = CURRENT_TIMESTAMP
+                """,
+                (user_id, username, first_name, last_name),
+            )
+            cached = self._cached_user(user_id)
+            if cached:
+                cached.username = username
+                cached.first_name = first_name
+                cached.last_name = last_name
+            logger.info("Пользователь %s добавлен/обновлен", user_id)
             return True
         except Exception as e:
-            logger.error(f"Ошибка добавления пользователя: {e}")
+            logger.error("Ошибка добавления пользователя: %s", e)
             return False
 
+    async def upsert_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+    ) -> Optional[UserRecord]:
+        """
+        Добавление/обновление пользователя с возвратом итоговой записи
+
+        Запись и чтение выполняются одним запросом (RETURNING) в одной
+        транзакции, без отдельного get_user.
+        """
+        self._users_version += 1
+        version = self._users_version
+        try:
+            rows = await self._write(
+                """
+                INSERT INTO users (user_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    last_active = CURRENT_TIMESTAMP
+                RETURNING *
+                """,
+                (user_id, username, first_name, last_name),
+                fetch=True,
+            )
+        except Exception as e:
+            logger.error("Ошибка добавления пользователя: %s", e)
+            return None
+
+        if not rows:
+            return None
+
+        # Если за время записи пользователей меняли, строка могла устареть
+        user = UserRecord.from_row(rows[0])
+        if self.user_cache is not None:
+            if version == self._users_version:
+                self.user_cache.set(user_id, user)
+            else:
+                self.user_cache.pop(user_id)
+        logger.info("Пользователь %s добавлен/обновлен", user_id)
+        return user
+
     async def update_user_subscription(self, user_id: int, is_subscribed: bool = True) -> bool:
         """Обновление статуса подписки"""
+        self._users_version += 1
         try:
-            async with self.connection.cursor() as cursor:
-                await cursor.execute(
-                    """
-                    UPDATE users
-                    SET is_subscribed = ?, last_active = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                    """,
-                    (is_subscribed, user_id),
-                )
-                await self.connection.commit()
-            logger.info(f"Подписка пользователя {user_id} обновлена: {is_subscribed}")
+            await self._write(
+                """
+                UPDATE users
+                SET is_subscribed = ?, last_active = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+                """,
+                (is_subscribed, user_id),
+            )
+            cached = self._cached_user(user_id)
+            if cached:
+                cached.is_subscribed = bool(is_subscribed)
+            logger.info("Подписка пользователя %s обновлена: %s", user_id, is_subscribed)
             return True
         except Exception as e:
-            logger.error(f"Ошибка обновления подписки: {e}")
+            logger.error("Ошибка обновления подписки: %s", e)
             return False
 
     async def mark_file_received(self, user_id: int) -> bool:
         """Отметить, что пользователь получил файл"""
+        self._users_version += 1
         try:
-            async with self.connection.cursor() as cursor:
-                await cursor.execute(
-                    """
-                    UPDATE users
-                    SET received_file = 1, last_active = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                    """,
-                    (user_id,),
-                )
-                await self.connection.commit()
-            logger.info(f"Пользователь {user_id} получил файл")
+            await self._write(
+                """
+                UPDATE users
+                SET received_file = 1, last_active = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+                """,
+                (user_id,),
+            )
+            cached = self._cached_user(user_id)
+            if cached:
+                cached.received_file = True
+            logger.info("Пользователь %s получил файл", user_id)
             return True
         except Exception as e:
-            logger.error(f"Ошибка отметки получения файла: {e}")
+            logger.error("Ошибка отметки получения файла: %s", e)
             return False
 
-    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получение информации о пользователе"""
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        """
+        Получение информации о пользователе
+
+        Запись отдается из кэша, если есть. Поле last_active в
+        закэшированной записи может отставать от БД.
+        """
+        if self.user_cache is not None:
+            cached = self.user_cache.get(user_id)
+            if cached is not None:
+                return cached
+
+        version = self._users_version
         try:
-            async with self.connection.cursor() as cursor:
+            async with self._reader() as cursor:
                 await cursor.execute(
                     "SELECT * FROM users WHERE user_id = ?", (user_id,)
                 )
                 row = await cursor.fetchone()
-                if row:
-                    return dict(row)
-            return None
         except Exception as e:
-            logger.error(f"Ошибка получения пользователя: {e}")
+            logger.error("Ошибка получения пользователя: %s", e)
             return None
 
+        if not row:
+            return None
+
+        user = UserRecord.from_row(row)
+        if self.user_cache is not None and version == self._users_version:
+            self.user_cache.set(user_id, user)
+        return user
+
     async def is_user_subscribed(self, user_id: int) -> bool:
         """Проверка статуса подписки в БД"""
         user = await self.get_user(user_id)
-        return user.get("is_subscribed", False) if user else False
+        return user.is_subscribed if user else False
 
     # === Работа с сообщениями ===
 
@@ -138,107 +589,822 @@ class Database:
     ) -> bool:
         """Сохранение сообщения"""
         try:
-            async with self.connection.cursor() as cursor:
+            await self._write(
+                """
+                INSERT INTO messages (user_id, message_text, is_from_admin)
+                VALUES (?, ?, ?)
+                """,
+                (user_id, message_text, is_from_admin),
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения сообщения: %s", e)
+            return False
+
+    async def get_user_messages(
+        self, user_id: int, limit: int = 10, include_archive: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Получение последних сообщений пользователя
+
+        Args:
+            include_archive: искать также в архиве (текст распаковывается)
+        """
+        query = """
+            SELECT id, user_id, message_text, is_from_admin, created_at
+            FROM messages
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """
+        params: Tuple = (user_id, limit)
+        if include_archive:
+            query = """
+                SELECT * FROM (
+                    SELECT id, user_id, message_text, is_from_admin, created_at
+                    FROM messages
+                    WHERE user_id = ?
+                    UNION ALL
+                    SELECT id, user_id, zdecompress(message_zlib), is_from_admin, created_at
+                    FROM messages_archive
+                    WHERE user_id = ?
+                )
+                ORDER BY created_at DESC
+                LIMIT ?
+            """
+            params = (user_id, user_id, limit)
+
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error("Ошибка получения сообщений: %s", e)
+            return []
+
+    # === Архив сообщений ===
+
+    @_on_writer
+    async def archive_messages(
+        self, older_than_days: float, batch_size: int = 500, pause: float = 0.05
+    ) -> int:
+        """
+        Перенос сообщений старше older_than_days дней в архив со сжатием
+
+        Каждая пачка - отдельная короткая транзакция, между пачками
+        пишущее соединение отпускается на pause секунд.
+
+        Returns:
+            int: число перенесенных сообщений
+        """
+        cutoff = (
+            datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        ).strftime("%Y-%m-%d %H:%M:%S")
+
+        moved = 0
+        while True:
+            try:
+                async with self._transaction() as cursor:
+                    # Ровно batch_size самых старых сообщений (по индексу
+                    # created_at); порядок id может не совпадать с created_at
+                    batch = """
+                        SELECT id FROM messages
+                        WHERE created_at < ?
+                        ORDER BY created_at, id
+                        LIMIT ?
+                    """
+                    await cursor.execute(
+                        f"""
+                        INSERT INTO messages_archive
+                            (id, user_id, message_zlib, is_from_admin, created_at)
+                        SELECT id, user_id, zcompress(message_text), is_from_admin, created_at
+                        FROM messages
+                        WHERE id IN ({batch})
+                        """,
+                        (cutoff, batch_size),
+                    )
+                    if not cursor.rowcount:
+                        break
+                    await cursor.execute(
+                        f"DELETE FROM messages WHERE id IN ({batch})",
+                        (cutoff, batch_size),
+                    )
+                    moved += cursor.rowcount
+            except Exception as e:
+                logger.error("Ошибка архивации сообщений: %s", e)
+                break
+
+            await asyncio.sleep(pause)
+
+        if moved:
+            logger.info("В архив перенесено сообщений: %s", moved)
+        return moved
+
+    @_on_writer
+    async def incremental_vacuum(self, pages_per_step: int = 1000, pause: float = 0.05) -> int:
+        """
+        Возврат свободных страниц файлу БД порциями (auto_vacuum = INCREMENTAL)
+
+        В другом режиме incremental_vacuum ничего не делает - выходим сразу.
+
+        Returns:
+            int: число освобожденных страниц
+        """
+        freed = 0
+        while True:
+            try:
+                async with self._write_lock:
+                    if await self._auto_vacuum_mode() != 2:
+                        break
+                    async with self.connection.execute("PRAGMA freelist_count") as cursor:
+                        free_pages = (await cursor.fetchone())[0]
+                    if not free_pages:
+                        break
+                    step = min(free_pages, pages_per_step)
+                    # execute() делает один шаг (одна страница), executescript - до конца
+                    await self.connection.executescript(f"PRAGMA incremental_vacuum({step});")
+                    async with self.connection.execute("PRAGMA freelist_count") as cursor:
+                        step = free_pages - (await cursor.fetchone())[0]
+                    # Шаг ничего не освободил - дальше тоже не освободит
+                    if step <= 0:
+                        break
+                    freed += step
+            except Exception as e:
+                logger.error("Ошибка incremental_vacuum: %s", e)
+                break
+
+            await asyncio.sleep(pause)
+
+        if freed:
+            logger.info("Освобождено страниц БД: %s", freed)
+        return freed
+
+    async def get_users_page(
+        self,
+        cursor_key: Optional[Tuple[str, int]] = None,
+        backward: bool = False,
+        limit: int = 20,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Страница пользователей от новых к старым (keyset по created_at, id)
+
+        Args:
+            cursor_key: (created_at, id) граничной записи соседней страницы
+            backward: False - следующая (более старые), True - предыдущая
+            limit: размер страницы
+
+        Returns:
+            (пользователи от новых к старым, есть ли еще записи в направлении листания)
+        """
+        if cursor_key is None:
+            where, order, params = "", "DESC", ()
+        elif backward:
+            where, order, params = "WHERE (created_at, id) > (?, ?)", "ASC", tuple(cursor_key)
+        else:
+            where, order, params = "WHERE (created_at, id) < (?, ?)", "DESC", tuple(cursor_key)
+
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    f"""
+                    SELECT * FROM users
+                    {where}
+                    ORDER BY created_at {order}, id {order}
+                    LIMIT ?
+                    """,
+                    (*params, limit + 1),
+                )
+                rows = [dict(row) for row in await cursor.fetchall()]
+        except Exception as e:
+            logger.error("Ошибка получения страницы пользователей: %s", e)
+            return [], False
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+        return rows, has_more
+
+    async def iter_users(self, batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый обход всех пользователей по возрастанию user_id
+
+        Читает таблицу пачками по batch_size (keyset-пагинация),
+        поэтому память не зависит от числа пользователей.
+        """
+        last_user_id = 0
+        while True:
+            try:
+                async with self._reader() as cursor:
+                    await cursor.execute(
+                        """
+                        SELECT * FROM users
+                        WHERE user_id > ?
+                        ORDER BY user_id
+                        LIMIT ?
+                        """,
+                        (last_user_id, batch_size),
+                    )
+                    rows = await cursor.fetchall()
+            except Exception as e:
+                logger.error("Ошибка чтения пользователей: %s", e)
+                return
+
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            last_user_id = rows[-1]["user_id"]
+
+    # === Маршруты ответов администратора ===
+
+    async def save_reply_route(self, admin_chat_id: int, message_id: int, user_id: int) -> bool:
+        """Запоминание, от какого пользователя сообщение в чате администратора"""
+        try:
+            await self._write(
+                """
+                INSERT OR REPLACE INTO admin_reply_routes
+                    (admin_chat_id, message_id, user_id, created_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (admin_chat_id, message_id, user_id, time.time()),
+            )
+            if self.route_cache is not None:
+                self.route_cache.set((admin_chat_id, message_id), user_id)
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения маршрута ответа: %s", e)
+            return False
+
+    async def get_reply_route(self, admin_chat_id: int, message_id: int) -> Optional[int]:
+        """user_id, которому адресован ответ на сообщение message_id"""
+        key = (admin_chat_id, message_id)
+        if self.route_cache is not None:
+            user_id = self.route_cache.get(key)
+            if user_id is not None:
+                return user_id
+
+        try:
+            async with self._reader() as cursor:
                 await cursor.execute(
                     """
-                    INSERT INTO messages (user_id, message_text, is_from_admin)
-                    VALUES (?, ?, ?)
+                    SELECT user_id FROM admin_reply_routes
+                    WHERE admin_chat_id = ? AND message_id = ? AND created_at >= ?
+                    """,
+                    (admin_chat_id, message_id, time.time() - self.route_ttl),
+                )
+                row = await cursor.fetchone()
+        except Exception as e:
+            logger.error("Ошибка получения маршрута ответа: %s", e)
+            return None
+
+        if not row:
+            return None
+        if self.route_cache is not None:
+            self.route_cache.set(key, row["user_id"])
+        return row["user_id"]
+
+    async def purge_reply_routes(self) -> int:
+        """Удаление маршрутов старше route_ttl"""
+        try:
+            deleted = await self._write(
+                "DELETE FROM admin_reply_routes WHERE created_at < ?",
+                (time.time() - self.route_ttl,),
+            )
+            if deleted:
+                logger.info("Удалено устаревших маршрутов ответов: %s", deleted)
+            return deleted
+        except Exception as e:
+            logger.error("Ошибка удаления маршрутов ответов: %s", e)
+            return 0
+
+    # === Состояния FSM ===
+
+    async def get_fsm_record(self, key: str) -> Optional[Dict[str, Any]]:
+        """Состояние и данные FSM: {"state", "data", "updated_at"} (None - нет или устарели)"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    "SELECT state, data, updated_at FROM fsm_states WHERE key = ? AND updated_at >= ?",
+                    (key, time.time() - self.fsm_ttl),
+                )
+                row = await cursor.fetchone()
+        except Exception as e:
+            logger.error("Ошибка получения состояния FSM %s: %s", key, e)
+            return None
+
+        if not row:
+            return None
+        return {
+            "state": row["state"],
+            "data": json.loads(row["data"]),
+            "updated_at": row["updated_at"],
+        }
+
+    async def save_fsm_record(self, key: str, state: Optional[str], data: Dict[str, Any]) -> bool:
+        """Сохранение состояния и данных FSM (пустая запись удаляется)"""
+        try:
+            if state is None and not data:
+                await self._write("DELETE FROM fsm_states WHERE key = ?", (key,))
+            else:
+                await self._write(
+                    """
+                    INSERT INTO fsm_states (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
                     """,
-                    (user_id, message_text, is_from_admin),
+                    (key, state, json.dumps(data, ensure_ascii=False), time.time()),
                 )
-                await self.connection.commit()
             return True
         except Exception as e:
-            logger.error(f"Ошибка сохранения сообщения: {e}")
+            logger.error("Ошибка сохранения состояния FSM %s: %s", key, e)
             return False
 
-    async def get_user_messages(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-        """Получение последних сообщений пользователя"""
+    async def purge_fsm_records(self) -> int:
+        """Удаление состояний FSM, брошенных дольше fsm_ttl"""
         try:
-            async with self.connection.cursor() as cursor:
+            deleted = await self._write(
+                "DELETE FROM fsm_states WHERE updated_at < ?",
+                (time.time() - self.fsm_ttl,),
+            )
+            if deleted:
+                logger.info("Удалено брошенных состояний FSM: %s", deleted)
+            return deleted
+        except Exception as e:
+            logger.error("Ошибка удаления состояний FSM: %s", e)
+            return 0
+
+    # === Зеркало участников канала ===
+
+    async def get_channel_member(self, channel: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """Статус пользователя в канале: {"status", "source", "updated_at"} или None"""
+        try:
+            async with self._reader() as cursor:
                 await cursor.execute(
                     """
-                    SELECT * FROM messages
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT ?
+                    SELECT status, source, updated_at FROM channel_members
+                    WHERE channel = ? AND user_id = ?
+                    """,
+                    (channel, user_id),
+                )
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error("Ошибка получения статуса в канале: %s", e)
+            return None
+
+    async def save_channel_member(
+        self, channel: str, user_id: int, status: str, source: str
+    ) -> bool:
+        """
+        Сохранение статуса пользователя в канале
+
+        Args:
+            source: "update" - из события chat_member, "api" - из getChatMember
+        """
+        try:
+            await self._write(
+                """
+                INSERT OR REPLACE INTO channel_members
+                    (channel, user_id, status, source, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (channel, user_id, status, source, time.time()),
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения статуса в канале: %s", e)
+            return False
+
+    # === Отложенные задачи ===
+
+    async def schedule_job(
+        self, user_id: int, kind: str, run_at: float, unique: bool = False
+    ) -> bool:
+        """
+        Постановка отложенной задачи (run_at - unix timestamp)
+
+        Args:
+            unique: не ставить, если у пользователя уже есть задача kind
+
+        Returns:
+            bool: True, если задача поставлена
+        """
+        try:
+            if unique:
+                inserted = await self._write(
+                    """
+                    INSERT INTO scheduled_jobs (user_id, kind, run_at)
+                    SELECT ?, ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM scheduled_jobs WHERE user_id = ? AND kind = ?
+                    )
                     """,
-                    (user_id, limit),
+                    (user_id, kind, run_at, user_id, kind),
+                )
+            else:
+                inserted = await self._write(
+                    """
+                    INSERT INTO scheduled_jobs (user_id, kind, run_at)
+                    VALUES (?, ?, ?)
+                    """,
+                    (user_id, kind, run_at),
+                )
+            return inserted > 0
+        except Exception as e:
+            logger.error("Ошибка постановки задачи %s для %s: %s", kind, user_id, e)
+            return False
+
+    @staticmethod
+    def _shard_filter(shard: Optional[Tuple[int, int]]) -> Tuple[str, Tuple]:
+        """Условие "задача своего шарда" для shard = (номер, число шардов)"""
+        if shard is None:
+            return "", ()
+        index, count = shard
+        return " AND user_id % ? = ?", (count, index)
+
+    async def get_next_job_time(self, shard: Optional[Tuple[int, int]] = None) -> Optional[float]:
+        """Время ближайшей ожидающей задачи"""
+        condition, params = self._shard_filter(shard)
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    "SELECT MIN(run_at) AS run_at FROM scheduled_jobs "
+                    "WHERE status = 'pending'" + condition,
+                    params,
+                )
+                row = await cursor.fetchone()
+                return row["run_at"] if row else None
+        except Exception as e:
+            logger.error("Ошибка получения ближайшей задачи: %s", e)
+            return None
+
+    @_on_writer
+    async def claim_due_jobs(
+        self, now: float, limit: int, shard: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Захват пачки наступивших задач (pending -> processing)"""
+        condition, params = self._shard_filter(shard)
+        try:
+            async with self._transaction() as cursor:
+                await cursor.execute(
+                    f"""
+                    UPDATE scheduled_jobs
+                    SET status = 'processing'
+                    WHERE id IN (
+                        SELECT id FROM scheduled_jobs
+                        WHERE status = 'pending' AND run_at <= ?{condition}
+                        ORDER BY run_at
+                        LIMIT ?
+                    )
+                    RETURNING id, user_id, kind, attempts
+                    """,
+                    (now, *params, limit),
                 )
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
         except Exception as e:
-            logger.error(f"Ошибка получения сообщений: {e}")
+            logger.error("Ошибка захвата задач: %s", e)
             return []
 
-    async def get_all_users(self) -> List[Dict[str, Any]]:
-        """Получение всех пользователей"""
+    async def complete_job(self, job_id: int) -> bool:
+        """Удаление выполненной задачи"""
         try:
-            async with self.connection.cursor() as cursor:
+            await self._write(
+                "DELETE FROM scheduled_jobs WHERE id = ?", (job_id,)
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка завершения задачи %s: %s", job_id, e)
+            return False
+
+    async def retry_job(self, job_id: int, run_at: float) -> bool:
+        """Возврат задачи в очередь после ошибки"""
+        try:
+            await self._write(
+                """
+                UPDATE scheduled_jobs
+                SET status = 'pending', attempts = attempts + 1, run_at = ?
+                WHERE id = ?
+                """,
+                (run_at, job_id),
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка повторной постановки задачи %s: %s", job_id, e)
+            return False
+
+    async def release_stale_jobs(self, shard: Optional[Tuple[int, int]] = None) -> int:
+        """Возврат задач, захваченных до перезапуска, в очередь"""
+        condition, params = self._shard_filter(shard)
+        try:
+            return await self._write(
+                "UPDATE scheduled_jobs SET status = 'pending' "
+                "WHERE status = 'processing'" + condition,
+                params,
+            )
+        except Exception as e:
+            logger.error("Ошибка восстановления задач: %s", e)
+            return 0
+
+    async def count_pending_jobs(self) -> int:
+        """Количество задач в очереди"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    "SELECT COUNT(*) AS total FROM scheduled_jobs WHERE status = 'pending'"
+                )
+                row = await cursor.fetchone()
+                return row["total"] if row else 0
+        except Exception as e:
+            logger.error("Ошибка подсчета задач: %s", e)
+            return 0
+
+    # === Файлы (кэш file_id) ===
+
+    async def get_assets(self) -> Dict[str, Dict[str, Any]]:
+        """Получение всех сохраненных file_id статических файлов"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute("SELECT path, sha256, file_id FROM assets")
+                rows = await cursor.fetchall()
+                return {row["path"]: dict(row) for row in rows}
+        except Exception as e:
+            logger.error("Ошибка получения файлов: %s", e)
+            return {}
+
+    async def save_asset(self, path: str, sha256: str, file_id: str) -> bool:
+        """Сохранение file_id загруженного файла"""
+        try:
+            await self._write(
+                """
+                INSERT INTO assets (path, sha256, file_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    sha256 = excluded.sha256,
+                    file_id = excluded.file_id,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (path, sha256, file_id),
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения файла %s: %s", path, e)
+            return False
+
+    # === Рассылки ===
+
+    @_on_writer
+    async def create_broadcast(
+        self,
+        admin_chat_id: int,
+        text: str,
+        from_chat_id: Optional[int] = None,
+        message_ids: Sequence[int] = (),
+        segment: Optional[Segment] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Создание рассылки со списком получателей из сегмента пользователей
+
+        message_ids - сообщения чата from_chat_id, которые копируются
+        получателям; без них рассылается text. Без segment получатели -
+        все пользователи.
+        """
+        where, where_params = (segment or Segment()).where()
+        try:
+            async with self._transaction() as cursor:
                 await cursor.execute(
+                    "INSERT INTO broadcasts (admin_chat_id, text) VALUES (?, ?)",
+                    (admin_chat_id, text),
+                )
+                broadcast_id = cursor.lastrowid
+
+                await cursor.executemany(
                     """
-                    SELECT * FROM users
-                    ORDER BY created_at DESC
+                    INSERT INTO broadcast_messages (broadcast_id, position, from_chat_id, message_id)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    [
+                        (broadcast_id, position, from_chat_id, message_id)
+                        for position, message_id in enumerate(message_ids)
+                    ],
+                )
+
+                # Получатели копируются внутри SQLite, без списка в памяти
+                await cursor.execute(
+                    f"""
+                    INSERT INTO broadcast_recipients (broadcast_id, user_id)
+                    SELECT ?, user_id FROM users WHERE {where}
+                    """,
+                    (broadcast_id, *where_params),
+                )
+                total = cursor.rowcount
+
+                await cursor.execute(
+                    "UPDATE broadcasts SET total = ? WHERE id = ?",
+                    (total, broadcast_id),
+                )
+
+            logger.info("Рассылка %s создана, получателей: %s", broadcast_id, total)
+            return await self.get_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error("Ошибка создания рассылки: %s", e)
+            return None
+
+    async def count_segment(self, segment: Segment) -> int:
+        """
+        Число пользователей в сегменте
+
+        Все пользователи и сегменты по одному флагу берутся из счетчиков
+        stats_counters (триггеры), остальные считаются по покрывающему индексу.
+        """
+        counter = COUNTER_SEGMENTS.get(segment)
+        if counter is not None:
+            name, inverted = counter
+            stats = await self.get_stats()
+            return stats["total_users"] - stats[name] if inverted else stats[name]
+
+        where, params = segment.where()
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    f"SELECT COUNT(*) AS total FROM users WHERE {where}", params
+                )
+                return (await cursor.fetchone())["total"]
+        except Exception as e:
+            logger.error("Ошибка подсчета сегмента: %s", e)
+            return 0
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        """Получение рассылки"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    "SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)
+                )
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error("Ошибка получения рассылки %s: %s", broadcast_id, e)
+            return None
+
+    async def get_broadcast_messages(self, broadcast_id: int) -> List[Dict[str, Any]]:
+        """Сообщения, которые копирует рассылка (пусто - рассылается текст)"""
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute(
                     """
+                    SELECT from_chat_id, message_id FROM broadcast_messages
+                    WHERE broadcast_id = ?
+                    ORDER BY position
+                    """,
+                    (broadcast_id,),
                 )
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
         except Exception as e:
-            logger.error(f"Ошибка получения пользователей: {e}")
+            logger.error("Ошибка получения сообщений рассылки %s: %s", broadcast_id, e)
             return []
 
-    async def get_all_user_ids(self) -> List[int]:
-        """Получение всех user_id для рассылки"""
+    async def get_running_broadcasts(self) -> List[Dict[str, Any]]:
+        """Незавершенные рассылки (для продолжения после перезапуска)"""
         try:
-            async with self.connection.cursor() as cursor:
-                await cursor.execute("SELECT user_id FROM users")
+            async with self._reader() as cursor:
+                await cursor.execute(
+                    "SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id"
+                )
                 rows = await cursor.fetchall()
-                return [row["user_id"] for row in rows]
+                return [dict(row) for row in rows]
         except Exception as e:
-            logger.error(f"Ошибка получения user_ids: {e}")
+            logger.error("Ошибка получения рассылок: %s", e)
             return []
 
-    # === Статистика ===
+    async def iter_pending_recipients(
+        self, broadcast_id: int, batch_size: int = 500
+    ) -> AsyncIterator[int]:
+        """Потоковый обход получателей, которым рассылка еще не отправлена"""
+        last_user_id = 0
+        while True:
+            try:
+                async with self._reader() as cursor:
+                    await cursor.execute(
+                        """
+                        SELECT user_id FROM broadcast_recipients
+                        WHERE broadcast_id = ? AND user_id > ? AND status = 'pending'
+                        ORDER BY user_id
+                        LIMIT ?
+                        """,
+                        (broadcast_id, last_user_id, batch_size),
+                    )
+                    rows = await cursor.fetchall()
+            except Exception as e:
+                logger.error("Ошибка получения получателей рассылки %s: %s", broadcast_id, e)
+                return
 
-    async def get_stats(self) -> Dict[str, int]:
-        """Получение статистики"""
-        try:
-            async with self.connection.cursor() as cursor:
-                # Общее количество пользователей
-                await cursor.execute("SELECT COUNT(*) as total FROM users")
-                total_row = await cursor.fetchone()
-                total_users = total_row["total"] if total_row else 0
+            for row in rows:
+                yield row["user_id"]
+            if len(rows) < batch_size:
+                return
+            last_user_id = rows[-1]["user_id"]
 
-                # Количество подписавшихся
-                await cursor.execute(
-                    "SELECT COUNT(*) as subscribed FROM users WHERE is_subscribed = 1"
+    @_on_writer
+    async def save_broadcast_results(
+        self, broadcast_id: int, results: List[Tuple[int, bool]]
+    ) -> bool:
+        """Сохранение результатов отправки пачкой: [(user_id, успех), ...]"""
+        if not results:
+            return True
+        sent = sum(1 for _, ok in results if ok)
+        try:
+            async with self._transaction() as cursor:
+                await cursor.executemany(
+                    """
+                    UPDATE broadcast_recipients SET status = ?
+                    WHERE broadcast_id = ? AND user_id = ?
+                    """,
+                    [
+                        ("sent" if ok else "failed", broadcast_id, user_id)
+                        for user_id, ok in results
+                    ],
                 )
-                subscribed_row = await cursor.fetchone()
-                subscribed_users = subscribed_row["subscribed"] if subscribed_row else 0
-
-                # Количество получивших файл
                 await cursor.execute(
-                    "SELECT COUNT(*) as received FROM users WHERE received_file = 1"
+                    """
+                    UPDATE broadcasts
+                    SET sent = sent + ?, failed = failed + ?
+                    WHERE id = ?
+                    """,
+                    (sent, len(results) - sent, broadcast_id),
                 )
-                received_row = await cursor.fetchone()
-                received_file = received_row["received"] if received_row else 0
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения прогресса рассылки %s: %s", broadcast_id, e)
+            return False
+
+    async def finish_broadcast(self, broadcast_id: int) -> bool:
+        """Отметка о завершении рассылки"""
+        try:
+            await self._write(
+                """
+                UPDATE broadcasts
+                SET status = 'finished', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (broadcast_id,),
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка завершения рассылки %s: %s", broadcast_id, e)
+            return False
 
-                # Общее количество сообщений
-                await cursor.execute("SELECT COUNT(*) as total_messages FROM messages")
-                messages_row = await cursor.fetchone()
-                total_messages = messages_row["total_messages"] if messages_row else 0
+    # === Статистика ===
 
-                return {
-                    "total_users": total_users,
-                    "subscribed_users": subscribed_users,
-                    "received_file": received_file,
-                    "total_messages": total_messages,
-                }
+    async def get_stats(self) -> Dict[str, int]:
+        """Получение статистики (из счетчиков, без подсчета по таблицам)"""
+        stats = {name: 0 for name in STATS_COUNTERS}
+        try:
+            async with self._reader() as cursor:
+                await cursor.execute("SELECT name, value FROM stats_counters")
+                rows = await cursor.fetchall()
+                stats.update({row["name"]: row["value"] for row in rows})
+                return stats
         except Exception as e:
-            logger.error(f"Ошибка получения статистики: {e}")
-            return {
-                "total_users": 0,
-                "subscribed_users": 0,
-                "received_file": 0,
-                "total_messages": 0,
-            }
+            logger.error("Ошибка получения статистики: %s", e)
+            return stats
+
+    @_on_writer
+    async def recount_stats(self) -> Dict[str, int]:
+        """Пересчет счетчиков статистики по таблицам"""
+        async with self._transaction() as cursor:
+            await cursor.execute(
+                """
+                SELECT
+                    COUNT(*) AS total_users,
+                    COALESCE(SUM(is_subscribed != 0), 0) AS subscribed_users,
+                    COALESCE(SUM(received_file != 0), 0) AS received_file
+                FROM users
+                """
+            )
+            stats = dict(await cursor.fetchone())
+
+            await cursor.execute(
+                """
+                SELECT (SELECT COUNT(*) FROM messages)
+                     + (SELECT COUNT(*) FROM messages_archive) AS total
+                """
+            )
+            stats["total_messages"] = (await cursor.fetchone())["total"]
+
+            await cursor.executemany(
+                """
+                INSERT INTO stats_counters (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value
+                """,
+                [(name, stats[name]) for name in STATS_COUNTERS],
+            )
+
+        logger.info("Счетчики статистики пересчитаны: %s", stats)
+        return stats
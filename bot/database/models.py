@@ -27,8 +27,216 @@ CREATE TABLE IF NOT EXISTS messages (
 )
 """
 
+# Архив старых сообщений: текст сжат zlib (функция zcompress в SQLite)
+CREATE_MESSAGES_ARCHIVE_TABLE = """
+CREATE TABLE IF NOT EXISTS messages_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    message_zlib BLOB NOT NULL,
+    is_from_admin BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP
+)
+"""
+
+# Какому пользователю отвечать на сообщение в чате администратора
+CREATE_ADMIN_REPLY_ROUTES_TABLE = """
+CREATE TABLE IF NOT EXISTS admin_reply_routes (
+    admin_chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (admin_chat_id, message_id)
+) WITHOUT ROWID
+"""
+
+CREATE_FSM_STATES_TABLE = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Зеркало участников канала: обновляется из chat_member и ответов getChatMember
+CREATE_CHANNEL_MEMBERS_TABLE = """
+CREATE TABLE IF NOT EXISTS channel_members (
+    channel TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (channel, user_id)
+) WITHOUT ROWID
+"""
+
+CREATE_SCHEDULED_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    run_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_ASSETS_TABLE = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_BROADCASTS_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+)
+"""
+
+CREATE_BROADCAST_RECIPIENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    broadcast_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (broadcast_id, user_id),
+    FOREIGN KEY (broadcast_id) REFERENCES broadcasts (id)
+) WITHOUT ROWID
+"""
+
+# Сообщения администратора, которые рассылка копирует получателям
+# (несколько - альбом, отправляется одним copyMessages)
+CREATE_BROADCAST_MESSAGES_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcast_messages (
+    broadcast_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    from_chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (broadcast_id, position),
+    FOREIGN KEY (broadcast_id) REFERENCES broadcasts (id)
+) WITHOUT ROWID
+"""
+
+CREATE_STATS_COUNTERS_TABLE = """
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+STATS_COUNTERS = ["total_users", "subscribed_users", "received_file", "total_messages"]
+
+# Счетчики статистики поддерживаются триггерами при каждой записи
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+        UPDATE stats_counters SET value = value + (COALESCE(NEW.is_subscribed, 0) != 0)
+            WHERE name = 'subscribed_users';
+        UPDATE stats_counters SET value = value + (COALESCE(NEW.received_file, 0) != 0)
+            WHERE name = 'received_file';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_update
+    AFTER UPDATE OF is_subscribed, received_file ON users
+    BEGIN
+        UPDATE stats_counters
+            SET value = value + (COALESCE(NEW.is_subscribed, 0) != 0)
+                              - (COALESCE(OLD.is_subscribed, 0) != 0)
+            WHERE name = 'subscribed_users';
+        UPDATE stats_counters
+            SET value = value + (COALESCE(NEW.received_file, 0) != 0)
+                              - (COALESCE(OLD.received_file, 0) != 0)
+            WHERE name = 'received_file';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+        UPDATE stats_counters SET value = value - (COALESCE(OLD.is_subscribed, 0) != 0)
+            WHERE name = 'subscribed_users';
+        UPDATE stats_counters SET value = value - (COALESCE(OLD.received_file, 0) != 0)
+            WHERE name = 'received_file';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_messages_insert AFTER INSERT ON messages
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_messages';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_messages_delete AFTER DELETE ON messages
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_messages';
+    END
+    """,
+    # Перенос в архив не меняет total_messages: -1 в messages, +1 в архиве
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_messages_archive_insert AFTER INSERT ON messages_archive
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_messages';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_messages_archive_delete AFTER DELETE ON messages_archive
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_messages';
+    END
+    """,
+]
+
 CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_user_id ON users(user_id)",
     "CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id)",
     "CREATE INDEX IF NOT EXISTS idx_created_at ON messages(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_user ON messages_archive(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_reply_routes_created ON admin_reply_routes(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at, id)",
+    # Сегменты рассылок: покрывающие индексы, подсчет и выборка user_id без таблицы
+    "CREATE INDEX IF NOT EXISTS idx_users_segment ON users(is_subscribed, received_file, last_active, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_due ON scheduled_jobs(status, run_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_user_kind ON scheduled_jobs(user_id, kind)",
+    "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)",
 ]
+
+# Миграции схемы: номер версии (PRAGMA user_version) -> запросы.
+# Версия 1 - схема целиком; запросы IF NOT EXISTS, поэтому она подходит
+# и для баз, созданных до нумерации версий. Изменения схемы добавляются
+# только новыми номерами, уже выпущенные миграции не меняются.
+SCHEMA_MIGRATIONS = {
+    1: [
+        CREATE_USERS_TABLE,
+        CREATE_MESSAGES_TABLE,
+        CREATE_MESSAGES_ARCHIVE_TABLE,
+        CREATE_ADMIN_REPLY_ROUTES_TABLE,
+        CREATE_FSM_STATES_TABLE,
+        CREATE_CHANNEL_MEMBERS_TABLE,
+        CREATE_SCHEDULED_JOBS_TABLE,
+        CREATE_ASSETS_TABLE,
+        CREATE_BROADCASTS_TABLE,
+        CREATE_BROADCAST_RECIPIENTS_TABLE,
+        CREATE_BROADCAST_MESSAGES_TABLE,
+        CREATE_STATS_COUNTERS_TABLE,
+        *CREATE_INDEXES,
+        *CREATE_TRIGGERS,
+    ],
+}
+
+SCHEMA_VERSION = max(SCHEMA_MIGRATIONS)
@@ -0,0 +1,53 @@
+"""
+Компактные записи для горячего пути (вместо dict)
+"""
+from typing import Any, Mapping
+
+
+class UserRecord:
+    """Профиль пользователя из таблицы users"""
+
+    __slots__ = (
+        "id",
+        "user_id",
+        "username",
+        "first_name",
+        "last_name",
+        "is_subscribed",
+        "received_file",
+        "created_at",
+        "last_active",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        user_id: int,
+        username: Any = None,
+        first_name: Any = None,
+        last_name: Any = None,
+        is_subscribed: bool = False,
+        received_file: bool = False,
+        created_at: Any = None,
+        last_active: Any = None,
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.is_subscribed = bool(is_subscribed)
+        self.received_file = bool(received_file)
+        self.created_at = created_at
+        self.last_active = last_active
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "UserRecord":
+        """Создание из строки БД"""
+        return cls(**{name: row[name] for name in cls.__slots__})
+
+    def __repr__(self) -> str:
+        return (
+            f"UserRecord(user_id={self.user_id}, username={self.username!r}, "
+            f"is_subscribed={self.is_subscribed}, received_file={self.received_file})"
+        )
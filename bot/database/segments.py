@@ -0,0 +1,66 @@
+"""
+Сегменты пользователей для рассылок
+
+Сегмент - набор условий на поля таблицы users. Условия по флагам и
+last_active идут по индексу idx_users_segment, по last_active без флагов -
+по idx_users_last_active, когорты по created_at - по idx_users_created.
+Размер сегментов из COUNTER_SEGMENTS берется из счетчиков статистики.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+def _days_ago(now: datetime, days: float) -> str:
+    """Граница периода в формате CURRENT_TIMESTAMP (UTC)"""
+    return (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Фильтр получателей рассылки (None - условие не применяется)"""
+
+    subscribed: Optional[bool] = None
+    received_file: Optional[bool] = None
+    active_within_days: Optional[float] = None  # писал или нажимал за последние N дней
+    inactive_for_days: Optional[float] = None  # не проявлялся N дней и дольше
+    joined_within_days: Optional[float] = None  # пришел за последние N дней
+    joined_before_days: Optional[float] = None  # пришел раньше, чем N дней назад
+
+    def where(self, now: Optional[datetime] = None) -> Tuple[str, tuple]:
+        """Условие WHERE (без слова WHERE) и его параметры"""
+        now = now or datetime.now(timezone.utc)
+        conditions: List[str] = []
+        params: list = []
+
+        if self.subscribed is not None:
+            conditions.append("is_subscribed = ?")
+            params.append(int(self.subscribed))
+        if self.received_file is not None:
+            conditions.append("received_file = ?")
+            params.append(int(self.received_file))
+        if self.active_within_days is not None:
+            conditions.append("last_active >= ?")
+            params.append(_days_ago(now, self.active_within_days))
+        if self.inactive_for_days is not None:
+            conditions.append("last_active < ?")
+            params.append(_days_ago(now, self.inactive_for_days))
+        if self.joined_within_days is not None:
+            conditions.append("created_at >= ?")
+            params.append(_days_ago(now, self.joined_within_days))
+        if self.joined_before_days is not None:
+            conditions.append("created_at < ?")
+            params.append(_days_ago(now, self.joined_before_days))
+
+        return " AND ".join(conditions) or "1", tuple(params)
+
+
+# Сегменты, размер которых уже есть в stats_counters:
+# сегмент -> (счетчик, True - это total_users минус счетчик)
+COUNTER_SEGMENTS: Dict[Segment, Tuple[str, bool]] = {
+    Segment(): ("total_users", False),
+    Segment(subscribed=True): ("subscribed_users", False),
+    Segment(subscribed=False): ("subscribed_users", True),
+    Segment(received_file=True): ("received_file", False),
+    Segment(received_file=False): ("received_file", True),
+}
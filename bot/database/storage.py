@@ -0,0 +1,86 @@
+"""
+Хранилище состояний FSM aiogram в SQLite
+
+Состояние и данные каждого ключа держатся в LRU-кэше: проверки состояния
+на каждом обновлении (StateFilter) не обращаются к БД. Изменения сразу
+записываются в таблицу fsm_states и переживают перезапуск. Состояния,
+не менявшиеся дольше Database.fsm_ttl, считаются брошенными: они не
+читаются и удаляются из таблицы (Database.purge_fsm_records).
+"""
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.cache import TTLCache
+from .db import Database
+
+# Запись кэша: (состояние, данные)
+_Record = Tuple[Optional[str], Dict[str, Any]]
+_EMPTY: _Record = (None, {})
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage: LRU-кэш в памяти и запись в таблицу fsm_states"""
+
+    def __init__(self, db: Database, cache_size: int = 10000):
+        self.db = db
+        # Кэшируются и отсутствующие записи: у большинства пользователей состояния нет
+        self.cache = TTLCache(maxsize=cache_size, ttl=db.fsm_ttl)
+
+    @staticmethod
+    def _db_key(key: StorageKey) -> str:
+        return ":".join(
+            str(part) if part is not None else ""
+            for part in (
+                key.bot_id,
+                key.chat_id,
+                key.user_id,
+                key.thread_id,
+                key.business_connection_id,
+                key.destiny,
+            )
+        )
+
+    async def _load(self, key: StorageKey) -> _Record:
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+
+        row = await self.db.get_fsm_record(self._db_key(key))
+        if row is None:
+            self.cache.set(key, _EMPTY)
+            return _EMPTY
+
+        record = (row["state"], row["data"])
+        # В кэше запись живет не дольше, чем в БД
+        self.cache.set(key, record, ttl=max(row["updated_at"] + self.db.fsm_ttl - time.time(), 0))
+        return record
+
+    async def _save(self, key: StorageKey, record: _Record):
+        self.cache.set(key, record)
+        await self.db.save_fsm_record(self._db_key(key), *record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        current_state, data = await self._load(key)
+        if state != current_state:
+            await self._save(key, (state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        state, current_data = await self._load(key)
+        if data != current_data:
+            await self._save(key, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(key)
+        return dict(data)
+
+    async def close(self) -> None:
+        # Соединения с БД закрывает Database
+        self.cache.clear()
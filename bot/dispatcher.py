@@ -0,0 +1,84 @@
+"""
+Сборка диспетчера: роутеры, middleware и метрики
+
+Один и тот же код собирает диспетчер обычного запуска, воркера
+кластера и нагрузочного теста (benchmarks/loadtest.py), поэтому
+тест меряет ту же цепочку обработки, что работает в боте.
+"""
+from typing import Any, Dict, Sequence
+
+from aiogram import Bot, Dispatcher
+
+from bot.config import config
+from bot.database import Database, SQLiteStorage
+from bot.handlers import main_router
+from bot.middlewares import (
+    HandlerMetricsMiddleware,
+    ApiMetricsMiddleware,
+    FirstUpdateMiddleware,
+    ThrottlingMiddleware,
+)
+from bot.utils.checks import subscription_cache
+from bot.utils.metrics import cache_collector, registry
+
+
+def create_dispatcher(
+    bot: Bot,
+    db: Database,
+    services: Dict[str, Any],
+    started_at: float,
+    outer: Sequence = (),
+) -> Dispatcher:
+    """
+    Диспетчер бота (состояния FSM хранятся в БД)
+
+    Args:
+        services: объекты, которые получают обработчики (db, scheduler, broadcaster)
+        started_at: time.monotonic() в начале запуска процесса
+        outer: middleware на update, которые выполняются раньше всех (замеры)
+    """
+    dp = Dispatcher(storage=SQLiteStorage(db, cache_size=config.fsm_cache_size))
+
+    # Подключаем роутеры
+    dp.include_router(main_router)
+
+    for middleware in outer:
+        dp.update.outer_middleware(middleware)
+
+    # Время до первого обновления - раньше всех остальных middleware
+    dp.update.outer_middleware(FirstUpdateMiddleware(started_at))
+
+    # Ограничение частоты обновлений от пользователя (раньше остальной обработки)
+    if config.throttle_rate > 0:
+        dp.update.outer_middleware(
+            ThrottlingMiddleware(
+                rate=config.throttle_rate,
+                burst=config.throttle_burst,
+                max_delay=config.throttle_max_delay,
+                slots=config.throttle_slots,
+                exempt=(config.admin_id,),
+            )
+        )
+
+    # Передача db, планировщика и рассылок в обработчики
+    @dp.update.outer_middleware()
+    async def services_middleware(handler, event, data):
+        """Middleware для передачи сервисов в обработчики"""
+        data.update(services)
+        return await handler(event, data)
+
+    # Метрики: время обработчиков (inner middleware действует и на
+    # вложенные роутеры) и запросов к Bot API
+    handler_metrics = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(handler_metrics)
+    bot.session.middleware(ApiMetricsMiddleware())
+
+    registry.add_collector(cache_collector({
+        "user": db.user_cache,
+        "reply_route": db.route_cache,
+        "fsm": dp.storage.cache,
+        "subscription": subscription_cache,
+    }))
+    return dp
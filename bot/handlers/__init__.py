@@ -2,7 +2,7 @@
 Модуль обработчиков команд и сообщений
 """
 from aiogram import Router
-from . import start, admin, messages
+from . import start, admin, messages, channel
 
 # Главный роутер для всех обработчиков
 main_router = Router()
@@ -11,5 +11,6 @@ main_router = Router()
 main_router.include_router(start.router)
 main_router.include_router(admin.router)
 main_router.include_router(messages.router)
+main_router.include_router(channel.router)
 
 __all__ = ["main_router"]
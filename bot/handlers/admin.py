@@ -1,23 +1,43 @@
 """
 Обработчики команд администратора
 """
+import csv
 import logging
-import asyncio
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot.config import config
-from bot.database import Database
+from bot.database import Database, Segment
+from bot.utils import BroadcastEngine, MediaGroupCollector
 
 logger = logging.getLogger(__name__)
 
 # Создаем роутер для админских команд
 router = Router()
 
+# Альбом для рассылки приходит несколькими сообщениями: ждем последнее
+broadcast_albums = MediaGroupCollector(delay=1.0)
+
+# Сегменты рассылки: ключ для callback_data -> (название, фильтр)
+BROADCAST_SEGMENTS: Dict[str, Tuple[str, Segment]] = {
+    "all": ("👥 Все пользователи", Segment()),
+    "subscribed": ("✅ Подписались", Segment(subscribed=True)),
+    "unsubscribed": ("❌ Не подписались", Segment(subscribed=False)),
+    "no_file": ("📎 Подписались, но без файла", Segment(subscribed=True, received_file=False)),
+    "active_7d": ("🔥 Активны за 7 дней", Segment(active_within_days=7)),
+    "inactive_30d": ("💤 Неактивны 30+ дней", Segment(inactive_for_days=30)),
+    "new_7d": ("🆕 Пришли за 7 дней", Segment(joined_within_days=7)),
+    "new_30d": ("📅 Пришли за 30 дней", Segment(joined_within_days=30)),
+}
+
 
 class BroadcastStates(StatesGroup):
     """Состояния для рассылки"""
@@ -38,29 +58,24 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
-@router.message(Command("admin"))
-async def cmd_admin(message: Message):
-    """Главное меню администратора"""
-    if not is_admin(message.from_user.id):
-        return
+def get_segments_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора сегмента рассылки"""
+    keyboard = [
+        [InlineKeyboardButton(text=title, callback_data=f"admin_segment:{key}")]
+        for key, (title, _) in BROADCAST_SEGMENTS.items()
+    ]
+    keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    await message.answer(
-        "🔐 <b>Панель администратора</b>\n\n"
-        "Выберите действие:",
-        parse_mode="HTML",
-        reply_markup=get_admin_keyboard()
-    )
 
+SEGMENT_CHOICE_TEXT = (
+    "📢 <b>Рассылка</b>\n\n"
+    "Выберите, кому отправить сообщение:"
+)
 
-@router.callback_query(F.data == "admin_stats")
-async def callback_stats(callback: CallbackQuery, db: Database):
-    """Статистика через callback"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("⛔ Нет доступа", show_alert=True)
-        return
-
-    stats = await db.get_stats()
 
+def format_stats(stats: dict) -> str:
+    """Текст статистики для админа"""
     stats_text = (
         "📊 <b>Статистика бота</b>\n\n"
         f"👥 Всего пользователей: <b>{stats['total_users']}</b>\n"
@@ -79,6 +94,32 @@ async def callback_stats(callback: CallbackQuery, db: Database):
             f"• Получили файл: <b>{file_rate:.1f}%</b>"
         )
 
+    return stats_text
+
+
+@router.message(Command("admin"))
+async def cmd_admin(message: Message):
+    """Главное меню администратора"""
+    if not is_admin(message.from_user.id):
+        return
+
+    await message.answer(
+        "🔐 <b>Панель администратора</b>\n\n"
+        "Выберите действие:",
+        parse_mode="HTML",
+        reply_markup=get_admin_keyboard()
+    )
+
+
+@router.callback_query(F.data == "admin_stats")
+async def callback_stats(callback: CallbackQuery, db: Database):
+    """Статистика через callback"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    stats_text = format_stats(await db.get_stats())
+
     await callback.message.edit_text(
         stats_text,
         parse_mode="HTML",
@@ -89,29 +130,29 @@ async def callback_stats(callback: CallbackQuery, db: Database):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_users")
-async def callback_users(callback: CallbackQuery, db: Database):
-    """Список пользователей через callback"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("⛔ Нет доступа", show_alert=True)
-        return
+USERS_PAGE_SIZE = 20
 
-    users = await db.get_all_users()
+
+async def render_users_page(
+    db: Database,
+    cursor_key: Optional[Tuple[str, int]] = None,
+    backward: bool = False,
+    page: int = 0,
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст и кнопки страницы списка пользователей"""
+    users, has_more = await db.get_users_page(cursor_key, backward, USERS_PAGE_SIZE)
+    stats = await db.get_stats()
+    back_row = [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]
 
     if not users:
-        await callback.message.edit_text(
+        return (
             "👥 <b>Пользователи</b>\n\nПока нет пользователей.",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]
-            ])
+            InlineKeyboardMarkup(inline_keyboard=[back_row]),
         )
-        await callback.answer()
-        return
 
     users_text = "👥 <b>Пользователи</b>\n\n"
 
-    for i, user in enumerate(users[:20], 1):  # Показываем первых 20
+    for i, user in enumerate(users, page * USERS_PAGE_SIZE + 1):
         username = f"@{user['username']}" if user['username'] else "—"
         name = f"{user['first_name'] or ''} {user['last_name'] or ''}".strip() or "—"
         subscribed = "✅" if user['is_subscribed'] else "❌"
@@ -119,33 +160,115 @@ async def callback_users(callback: CallbackQuery, db: Database):
 
         users_text += f"{i}. {name} ({username}) {subscribed}{file_received}\n"
 
-    if len(users) > 20:
-        users_text += f"\n<i>...и ещё {len(users) - 20} пользователей</i>"
+    users_text += f"\n\n<b>Всего: {stats['total_users']}</b>"
 
-    users_text += f"\n\n<b>Всего: {len(users)}</b>"
+    # В callback_data передаем (created_at, id) крайних записей страницы
+    has_prev = has_more if backward else page > 0
+    has_next = True if backward else has_more
+    first, last = users[0], users[-1]
 
-    await callback.message.edit_text(
-        users_text,
-        parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]
-        ])
+    nav_row = []
+    if has_prev:
+        nav_row.append(InlineKeyboardButton(
+            text="⬅️",
+            callback_data=f"admin_users:p:{page - 1}:{first['created_at']}|{first['id']}",
+        ))
+    if has_next:
+        nav_row.append(InlineKeyboardButton(
+            text="➡️",
+            callback_data=f"admin_users:n:{page + 1}:{last['created_at']}|{last['id']}",
+        ))
+
+    keyboard = [nav_row, back_row] if nav_row else [back_row]
+    return users_text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+@router.callback_query(F.data == "admin_users")
+async def callback_users(callback: CallbackQuery, db: Database):
+    """Список пользователей через callback"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    users_text, keyboard = await render_users_page(db)
+
+    await callback.message.edit_text(users_text, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_users:"))
+async def callback_users_page(callback: CallbackQuery, db: Database):
+    """Листание списка пользователей"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    try:
+        _, direction, page, key = callback.data.split(":", 3)
+        created_at, user_row_id = key.rsplit("|", 1)
+        cursor_key = (created_at, int(user_row_id))
+        page = max(int(page), 0)
+    except ValueError:
+        await callback.answer("⚠️ Некорректная страница", show_alert=True)
+        return
+
+    users_text, keyboard = await render_users_page(
+        db, cursor_key, backward=direction == "p", page=page
     )
+
+    try:
+        await callback.message.edit_text(users_text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest:
+        # Страница не изменилась
+        pass
     await callback.answer()
 
 
 @router.callback_query(F.data == "admin_broadcast")
 async def callback_broadcast(callback: CallbackQuery, state: FSMContext):
-    """Начало рассылки"""
+    """Начало рассылки: выбор сегмента"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔ Нет доступа", show_alert=True)
         return
 
+    await state.clear()
+
+    await callback.message.edit_text(
+        SEGMENT_CHOICE_TEXT,
+        parse_mode="HTML",
+        reply_markup=get_segments_keyboard()
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_segment:"))
+async def callback_segment(callback: CallbackQuery, state: FSMContext, db: Database):
+    """Выбор сегмента: оценка числа получателей и ожидание сообщения"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    key = callback.data.split(":", 1)[1]
+    if key not in BROADCAST_SEGMENTS:
+        await callback.answer("⚠️ Неизвестный сегмент", show_alert=True)
+        return
+
+    title, segment = BROADCAST_SEGMENTS[key]
+    count = await db.count_segment(segment)
+    if not count:
+        await callback.answer("В этом сегменте нет пользователей", show_alert=True)
+        return
+
     await state.set_state(BroadcastStates.waiting_for_message)
+    await state.update_data(segment=key)
 
+    # Число оценочное: получатели фиксируются в момент запуска рассылки
     await callback.message.edit_text(
         "📢 <b>Рассылка</b>\n\n"
-        "Отправьте сообщение, которое хотите разослать всем пользователям.\n\n"
+        f"Сегмент: <b>{title}</b>\n"
+        f"Получателей: <b>~{count}</b>\n\n"
+        "Отправьте сообщение для рассылки.\n"
+        "Подойдет текст с форматированием, фото, видео, документ или альбом.\n\n"
         "<i>Для отмены отправьте /cancel</i>",
         parse_mode="HTML"
     )
@@ -185,40 +308,53 @@ async def cmd_cancel(message: Message, state: FSMContext):
 
 
 @router.message(BroadcastStates.waiting_for_message)
-async def process_broadcast(message: Message, state: FSMContext, db: Database):
-    """Обработка сообщения для рассылки"""
+async def process_broadcast(message: Message, state: FSMContext, broadcaster: BroadcastEngine):
+    """
+    Обработка сообщения для рассылки
+
+    Подойдет сообщение любого типа с форматированием или альбом: получатели
+    получат его копию (copyMessage), файлы не загружаются заново.
+    """
     if not is_admin(message.from_user.id):
         return
 
-    await state.clear()
-
-    user_ids = await db.get_all_user_ids()
-
-    if not user_ids:
-        await message.answer("❌ Нет пользователей для рассылки.")
+    if message.media_group_id:
+        # Состояние сбрасывается, когда соберется весь альбом
+        broadcast_albums.add(
+            message, lambda messages: start_broadcast(messages, state, broadcaster)
+        )
         return
 
-    await message.answer(f"📢 Начинаю рассылку для {len(user_ids)} пользователей...")
+    await start_broadcast([message], state, broadcaster)
 
-    success = 0
-    failed = 0
 
-    for user_id in user_ids:
-        try:
-            await message.bot.send_message(chat_id=user_id, text=message.text)
-            success += 1
-            await asyncio.sleep(0.05)  # Небольшая задержка для избежания лимитов
-        except Exception as e:
-            logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-            failed += 1
+async def start_broadcast(
+    messages: List[Message], state: FSMContext, broadcaster: BroadcastEngine
+):
+    """Запуск рассылки копий сообщений администратора по выбранному сегменту"""
+    data = await state.get_data()
+    await state.clear()
+    _, segment = BROADCAST_SEGMENTS.get(data.get("segment"), BROADCAST_SEGMENTS["all"])
 
-    await message.answer(
-        f"✅ <b>Рассылка завершена</b>\n\n"
-        f"Успешно: {success}\n"
-        f"Ошибок: {failed}",
-        parse_mode="HTML"
+    first = messages[0]
+    # Подпись рассылки в БД: текст или подпись альбома, иначе тип сообщения
+    text = next(
+        (m.text or m.caption for m in messages if m.text or m.caption),
+        f"[{first.content_type}]",
+    )
+
+    # Рассылка идет в фоне, прогресс и итог придут отдельными сообщениями
+    total = await broadcaster.start(
+        first.chat.id,
+        text,
+        from_chat_id=first.chat.id,
+        message_ids=[m.message_id for m in messages],
+        segment=segment,
     )
 
+    if not total:
+        await first.answer("❌ Нет пользователей для рассылки.")
+
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message, db: Database):
@@ -227,28 +363,50 @@ async def cmd_stats(message: Message, db: Database):
         await message.answer("⛔ У вас нет доступа к этой команде.")
         return
 
-    stats = await db.get_stats()
+    stats_text = format_stats(await db.get_stats())
 
-    stats_text = (
-        "📊 <b>Статистика бота</b>\n\n"
-        f"👥 Всего пользователей: <b>{stats['total_users']}</b>\n"
-        f"✅ Подписались: <b>{stats['subscribed_users']}</b>\n"
-        f"📎 Получили файл: <b>{stats['received_file']}</b>\n"
-        f"💬 Всего сообщений: <b>{stats['total_messages']}</b>\n"
-    )
+    await message.answer(stats_text, parse_mode="HTML")
+    logger.info(f"Администратор {message.from_user.id} запросил статистику")
 
-    if stats['total_users'] > 0:
-        subscription_rate = (stats['subscribed_users'] / stats['total_users']) * 100
-        file_rate = (stats['received_file'] / stats['total_users']) * 100
 
-        stats_text += (
-            f"\n📈 <b>Конверсия:</b>\n"
-            f"• В подписку: <b>{subscription_rate:.1f}%</b>\n"
-            f"• Получили файл: <b>{file_rate:.1f}%</b>"
-        )
+@router.message(Command("recount"))
+async def cmd_recount(message: Message, db: Database):
+    """Команда /recount - пересчет счетчиков статистики по таблицам"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
 
-    await message.answer(stats_text, parse_mode="HTML")
-    logger.info(f"Администратор {message.from_user.id} запросил статистику")
+    try:
+        stats = await db.recount_stats()
+    except Exception as e:
+        logger.error(f"Ошибка пересчета статистики: {e}")
+        await message.answer(f"❌ Ошибка пересчета статистики: {e}")
+        return
+
+    await message.answer("🔄 Счетчики пересчитаны\n\n" + format_stats(stats), parse_mode="HTML")
+    logger.info(f"Администратор {message.from_user.id} пересчитал статистику")
+
+
+@router.message(Command("vacuum"))
+async def cmd_vacuum(message: Message, db: Database):
+    """Команда /vacuum - перевод БД в auto_vacuum = INCREMENTAL (полный VACUUM)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+
+    await message.answer("⏳ VACUUM: запись в БД приостановлена до завершения...")
+    try:
+        enabled = await db.enable_incremental_vacuum()
+    except Exception as e:
+        logger.error(f"Ошибка VACUUM: {e}")
+        await message.answer(f"❌ Ошибка VACUUM: {e}")
+        return
+
+    await message.answer(
+        "✅ БД в режиме auto_vacuum = INCREMENTAL" if enabled
+        else "⚠️ Режим auto_vacuum не изменился"
+    )
+    logger.info(f"Администратор {message.from_user.id} выполнил VACUUM")
 
 
 @router.message(Command("users"))
@@ -258,28 +416,46 @@ async def cmd_users(message: Message, db: Database):
         await message.answer("⛔ У вас нет доступа к этой команде.")
         return
 
-    users = await db.get_all_users()
+    users_text, keyboard = await render_users_page(db)
 
-    if not users:
-        await message.answer("👥 Пока нет пользователей.")
-        return
-
-    users_text = "👥 <b>Пользователи</b>\n\n"
+    await message.answer(users_text, parse_mode="HTML", reply_markup=keyboard)
 
-    for i, user in enumerate(users[:20], 1):
-        username = f"@{user['username']}" if user['username'] else "—"
-        name = f"{user['first_name'] or ''} {user['last_name'] or ''}".strip() or "—"
-        subscribed = "✅" if user['is_subscribed'] else "❌"
-        file_received = "📎" if user['received_file'] else ""
 
-        users_text += f"{i}. {name} ({username}) {subscribed}{file_received}\n"
+EXPORT_FIELDS = [
+    "user_id", "username", "first_name", "last_name",
+    "is_subscribed", "received_file", "created_at", "last_active",
+]
 
-    if len(users) > 20:
-        users_text += f"\n<i>...и ещё {len(users) - 20} пользователей</i>"
 
-    users_text += f"\n\n<b>Всего: {len(users)}</b>"
+@router.message(Command("export"))
+async def cmd_export(message: Message, db: Database):
+    """Команда /export - выгрузка пользователей в CSV"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
 
-    await message.answer(users_text, parse_mode="HTML")
+    # Пишем файл построчно по мере чтения из БД, не собирая список в памяти
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    try:
+        count = 0
+        with os.fdopen(fd, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            async for user in db.iter_users():
+                writer.writerow(user)
+                count += 1
+
+        if not count:
+            await message.answer("👥 Пока нет пользователей.")
+            return
+
+        await message.answer_document(
+            FSInputFile(path, filename="users.csv"),
+            caption=f"📥 Пользователей: {count}",
+        )
+        logger.info(f"Администратор {message.from_user.id} выгрузил {count} пользователей")
+    finally:
+        os.remove(path)
 
 
 @router.message(Command("broadcast"))
@@ -289,45 +465,50 @@ async def cmd_broadcast(message: Message, state: FSMContext):
         await message.answer("⛔ У вас нет доступа к этой команде.")
         return
 
-    await state.set_state(BroadcastStates.waiting_for_message)
+    await state.clear()
 
     await message.answer(
-        "📢 <b>Рассылка</b>\n\n"
-        "Отправьте сообщение, которое хотите разослать всем пользователям.\n\n"
-        "<i>Для отмены отправьте /cancel</i>",
-        parse_mode="HTML"
+        SEGMENT_CHOICE_TEXT,
+        parse_mode="HTML",
+        reply_markup=get_segments_keyboard()
     )
 
 
 @router.message(F.reply_to_message)
 async def reply_to_user(message: Message, db: Database):
-    """Ответ администратора пользователю через reply"""
+    """
+    Ответ администратора пользователю через reply
+
+    Адресат ищется в таблице маршрутов по message_id пересланного сообщения.
+    Для карточек, отправленных до появления таблицы, ID разбирается из текста.
+    """
     if not is_admin(message.from_user.id):
         return
 
-    replied_text = message.reply_to_message.text or message.reply_to_message.caption
+    user_id = await db.get_reply_route(message.chat.id, message.reply_to_message.message_id)
 
-    if not replied_text or "[ID:" not in replied_text:
-        await message.answer(
-            "⚠️ Не удалось определить пользователя. "
-            "Отвечайте только на сообщения от пользователей."
-        )
-        return
+    if user_id is None:
+        replied_text = message.reply_to_message.text or message.reply_to_message.caption
 
-    try:
-        user_id_str = replied_text.split("[ID:")[1].split("]")[0].strip()
-        user_id = int(user_id_str)
-    except (IndexError, ValueError):
-        await message.answer("⚠️ Ошибка парсинга ID пользователя.")
-        return
+        if not replied_text or "[ID:" not in replied_text:
+            await message.answer(
+                "⚠️ Не удалось определить пользователя. "
+                "Отвечайте только на сообщения от пользователей."
+            )
+            return
+
+        try:
+            user_id_str = replied_text.split("[ID:")[1].split("]")[0].strip()
+            user_id = int(user_id_str)
+        except (IndexError, ValueError):
+            await message.answer("⚠️ Ошибка парсинга ID пользователя.")
+            return
 
     try:
-        await message.bot.send_message(
-            chat_id=user_id,
-            text=message.text
-        )
+        await message.copy_to(chat_id=user_id)
 
-        await db.save_message(user_id, message.text, is_from_admin=True)
+        content = message.text or message.caption or f"[{message.content_type}]"
+        await db.save_message(user_id, content, is_from_admin=True)
 
         await message.answer(f"✅ Сообщение отправлено пользователю {user_id}")
 
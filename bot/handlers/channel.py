@@ -0,0 +1,47 @@
+"""
+Обработчик изменений состава канала (chat_member)
+
+Telegram присылает chat_member, только если бот - администратор канала.
+Статус участника записывается в зеркало channel_members: проверка подписки
+берет его оттуда без запроса getChatMember.
+"""
+import logging
+from aiogram import Router
+from aiogram.types import Chat, ChatMemberUpdated
+
+from bot.config import config
+from bot.database import Database
+from bot.utils.checks import SUBSCRIBED_STATUSES, member_status, subscription_cache
+
+logger = logging.getLogger(__name__)
+
+# Создаем роутер для событий канала
+router = Router()
+
+
+def is_configured_channel(chat: Chat) -> bool:
+    """Событие из канала CHANNEL_ID (он задается ID или @username)"""
+    channel_id = config.channel_id
+    if channel_id.startswith("@"):
+        return chat.username is not None and channel_id[1:].lower() == chat.username.lower()
+    return channel_id == str(chat.id)
+
+
+@router.chat_member()
+async def on_channel_member(event: ChatMemberUpdated, db: Database):
+    """Подписка, выход или бан участника канала"""
+    if not is_configured_channel(event.chat):
+        return
+
+    user_id = event.new_chat_member.user.id
+    status = member_status(event.new_chat_member.status)
+    is_member = status in SUBSCRIBED_STATUSES
+
+    await db.save_channel_member(config.channel_id, user_id, status, source="update")
+    # Событие точнее кэша: отказ тоже держим на полный TTL
+    subscription_cache.set(
+        (config.channel_id, user_id), is_member, ttl=config.subscription_cache_ttl
+    )
+    await db.update_user_subscription(user_id, is_member)
+
+    logger.info("Участник %s канала %s: %s", user_id, config.channel_id, status)
@@ -22,13 +22,15 @@ async def handle_user_message(message: Message, db: Database):
 
     1. Сохраняем сообщение в БД
     2. Пересылаем администратору с информацией о пользователе
-    3. Отправляем пользователю подтверждение
+    3. Запоминаем, какому пользователю принадлежит пересланное сообщение,
+       чтобы Reply администратора нашел адресата без разбора текста
     """
     user = message.from_user
     user_id = user.id
+    content = message.text or message.caption or f"[{message.content_type}]"
 
     # Сохраняем сообщение в БД
-    await db.save_message(user_id, message.text, is_from_admin=False)
+    await db.save_message(user_id, content, is_from_admin=False)
 
     # Формируем информацию о пользователе
     user_info = f"@{user.username}" if user.username else "Нет username"
@@ -36,8 +38,8 @@ async def handle_user_message(message: Message, db: Database):
 
     # Получаем информацию о пользователе из БД
     user_data = await db.get_user(user_id)
-    is_subscribed = user_data.get("is_subscribed", False) if user_data else False
-    received_file = user_data.get("received_file", False) if user_data else False
+    is_subscribed = user_data.is_subscribed if user_data else False
+    received_file = user_data.received_file if user_data else False
 
     # Формируем сообщение для администратора
     admin_message = (
@@ -47,17 +49,24 @@ async def handle_user_message(message: Message, db: Database):
         f"🆔 <b>[ID: {user_id}]</b>\n"
         f"✅ <b>Подписан:</b> {'Да' if is_subscribed else 'Нет'}\n"
         f"📎 <b>Получил файл:</b> {'Да' if received_file else 'Нет'}\n\n"
-        f"💬 <b>Сообщение:</b>\n{message.text}\n\n"
+        f"💬 <b>Сообщение:</b>\n{content}\n\n"
         f"<i>Чтобы ответить, используйте Reply на это сообщение</i>"
     )
 
     # Отправляем администратору
     try:
-        await message.bot.send_message(
+        sent = await message.bot.send_message(
             chat_id=config.admin_id,
             text=admin_message,
             parse_mode="HTML"
         )
+        await db.save_reply_route(config.admin_id, sent.message_id, user_id)
+
+        # Фото, документы и т.п. копируем следом, Reply на копию тоже работает
+        if not message.text:
+            copied = await message.copy_to(chat_id=config.admin_id)
+            await db.save_reply_route(config.admin_id, copied.message_id, user_id)
+
         logger.info(f"Сообщение от пользователя {user_id} отправлено администратору")
     except Exception as e:
         logger.error(f"Ошибка отправки сообщения администратору: {e}")
@@ -2,17 +2,16 @@
 Обработчик команды /start и проверки подписки
 """
 import logging
-import asyncio
-import os
+from functools import partial
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 from bot.config import config
 from bot.database import Database
 from bot.keyboards import get_subscription_keyboard, get_article_keyboard
-from bot.utils import check_user_subscription
+from bot.utils import check_user_subscription, JobScheduler, AssetRegistry, SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -24,31 +23,49 @@ ARTICLE_LINK = "https://teletype.in/@kowalski_inga/S3OpxEKn4Qh"
 DELAY_BONUS = 5 * 60  # 5 минут в секундах
 DELAY_CONTACT = 30  # 30 секунд
 
+# Типы отложенных задач
+JOB_BONUS_PDF = "bonus_pdf"
+JOB_CONTACT = "contact"
 
-async def send_bonus_pdf(bot, user_id: int, db: Database):
-    """Отправка бонусного PDF"""
+# Повторные нажатия "Я подписался" во время проверки ждут ее результат
+subscription_flights = SingleFlight("check_subscription_callback")
+
+
+async def send_bonus_pdf(
+    bot, user_id: int, db: Database, assets: AssetRegistry, scheduler: JobScheduler
+):
+    """
+    Отправка бонусного PDF и постановка контактного сообщения
+
+    Временные ошибки (429, сеть, 5xx) уходят планировщику - он повторит задачу.
+    Контакты ставятся только после бонуса, поэтому повтор бонуса
+    не меняет порядок сообщений.
+    """
     try:
-        if os.path.exists(config.pdf_file_path):
-            pdf_file = FSInputFile(config.pdf_file_path)
-            await bot.send_document(
-                chat_id=user_id,
-                document=pdf_file,
-                caption=(
-                    "А это бонусный материал - чеклист с вопросами для ИИ.\n\n"
-                    "Поможет подробно обсудить твой проект и заранее "
-                    "разобраться во всех важных моментах."
-                )
+        await assets.send_document(
+            bot,
+            chat_id=user_id,
+            path=config.pdf_file_path,
+            caption=(
+                "А это бонусный материал - чеклист с вопросами для ИИ.\n\n"
+                "Поможет подробно обсудить твой проект и заранее "
+                "разобраться во всех важных моментах."
             )
-            await db.mark_file_received(user_id)
-            logger.info(f"PDF отправлен пользователю {user_id}")
-        else:
-            logger.error(f"PDF файл не найден: {config.pdf_file_path}")
-    except Exception as e:
+        )
+        await db.mark_file_received(user_id)
+        logger.info(f"PDF отправлен пользователю {user_id}")
+    except FileNotFoundError:
+        logger.error(f"PDF файл не найден: {config.pdf_file_path}")
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        # Бот заблокирован, чат не найден и т.п. - повтор не поможет
         logger.error(f"Ошибка отправки PDF пользователю {user_id}: {e}")
 
+    # Контакты через 30 секунд после бонуса
+    await scheduler.schedule(user_id, JOB_CONTACT, DELAY_CONTACT, unique=True)
+
 
 async def send_contact_message(bot, user_id: int):
-    """Отправка контактного сообщения"""
+    """Отправка контактного сообщения (временные ошибки повторит планировщик)"""
     try:
         await bot.send_message(
             chat_id=user_id,
@@ -60,30 +77,39 @@ async def send_contact_message(bot, user_id: int):
             )
         )
         logger.info(f"Контактное сообщение отправлено пользователю {user_id}")
-    except Exception as e:
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
         logger.error(f"Ошибка отправки контактного сообщения пользователю {user_id}: {e}")
 
 
-async def send_delayed_messages(bot, user_id: int, db: Database):
-    """Отложенная отправка бонуса и контактов"""
-    # Ждём 5 минут
-    await asyncio.sleep(DELAY_BONUS)
-    await send_bonus_pdf(bot, user_id, db)
+def register_jobs(scheduler: JobScheduler, db: Database, assets: AssetRegistry):
+    """Регистрация обработчиков отложенных задач воронки"""
+    scheduler.register(
+        JOB_BONUS_PDF, partial(send_bonus_pdf, db=db, assets=assets, scheduler=scheduler)
+    )
+    scheduler.register(JOB_CONTACT, send_contact_message)
+
 
-    # Ждём 30 секунд
-    await asyncio.sleep(DELAY_CONTACT)
-    await send_contact_message(bot, user_id)
+async def schedule_delayed_messages(scheduler: JobScheduler, user_id: int) -> bool:
+    """
+    Отложенная отправка бонуса и контактов
+
+    Бонус - через 5 минут, контакты ставит задача бонуса после отправки.
+
+    Returns:
+        bool: False, если материалы пользователю уже запланированы
+    """
+    return await scheduler.schedule(user_id, JOB_BONUS_PDF, DELAY_BONUS, unique=True)
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, db: Database):
+async def cmd_start(message: Message, db: Database, scheduler: JobScheduler):
     """
     Обработчик команды /start
     """
     user = message.from_user
 
-    # Добавляем/обновляем пользователя в БД
-    await db.add_user(
+    # Добавляем/обновляем пользователя в БД и сразу получаем его запись
+    user_data = await db.upsert_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -93,8 +119,7 @@ async def cmd_start(message: Message, db: Database):
     logger.info(f"Пользователь {user.id} ({user.username}) запустил бота")
 
     # Проверяем, получал ли уже материалы
-    user_data = await db.get_user(user.id)
-    already_received = user_data.get("received_file", False) if user_data else False
+    already_received = user_data.received_file if user_data else False
 
     if already_received:
         # Уже получал материалы - просто приветствуем
@@ -111,6 +136,7 @@ async def cmd_start(message: Message, db: Database):
         bot=message.bot,
         user_id=user.id,
         channel_id=config.channel_id,
+        db=db,
     )
 
     if is_subscribed:
@@ -126,7 +152,7 @@ async def cmd_start(message: Message, db: Database):
         )
 
         # Запускаем отложенную отправку (5 мин + 30 сек)
-        asyncio.create_task(send_delayed_messages(message.bot, user.id, db))
+        await schedule_delayed_messages(scheduler, user.id)
 
     else:
         # Пользователь НЕ подписан - показываем кнопки подписки
@@ -141,17 +167,54 @@ async def cmd_start(message: Message, db: Database):
 
 
 @router.callback_query(F.data == "check_subscription")
-async def check_subscription_callback(callback: CallbackQuery, db: Database):
+async def check_subscription_callback(
+    callback: CallbackQuery, db: Database, scheduler: JobScheduler
+):
     """
     Обработчик нажатия на кнопку "Я подписался"
-    """
-    user_id = callback.from_user.id
 
+    Нажатия одного пользователя, пришедшие во время проверки,
+    не проверяют заново, а получают ее результат.
+    """
     await callback.answer("Проверяю подписку... ⏳", show_alert=False)
 
-    # Проверяем, получал ли уже материалы
+    is_subscribed = await subscription_flights.do(
+        callback.from_user.id, partial(process_subscription, callback, db, scheduler)
+    )
+
+    if not is_subscribed:
+        # Не подписан
+        await callback.answer(
+            "❌ Вы еще не подписались на канал!\n\n"
+            "Подпишитесь и нажмите кнопку еще раз.",
+            show_alert=True,
+        )
+        logger.info(f"Пользователь {callback.from_user.id} не прошёл проверку подписки")
+
+
+async def process_subscription(
+    callback: CallbackQuery, db: Database, scheduler: JobScheduler
+) -> bool:
+    """
+    Проверка подписки и выдача материалов
+
+    Returns:
+        bool: False, если пользователь не подписан
+    """
+    user = callback.from_user
+    user_id = user.id
+
+    # Проверяем, получал ли уже материалы (чтение из кэша). Запись
+    # создает /start; если ее нет, создаем до update_user_subscription
     user_data = await db.get_user(user_id)
-    already_received = user_data.get("received_file", False) if user_data else False
+    if user_data is None:
+        user_data = await db.upsert_user(
+            user_id=user_id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+        )
+    already_received = user_data.received_file if user_data else False
 
     if already_received:
         try:
@@ -162,41 +225,39 @@ async def check_subscription_callback(callback: CallbackQuery, db: Database):
             "Ты уже получал материалы ранее.\n"
             "Если есть вопросы - просто напиши мне!"
         )
-        return
+        return True
 
     # Проверяем подписку
     is_subscribed = await check_user_subscription(
         bot=callback.bot,
         user_id=user_id,
         channel_id=config.channel_id,
+        db=db,
     )
 
-    if is_subscribed:
-        # Пользователь подписан
-        await db.update_user_subscription(user_id, is_subscribed=True)
-
-        # Удаляем кнопки
-        try:
-            await callback.message.edit_reply_markup(reply_markup=None)
-        except TelegramBadRequest:
-            pass
-
-        # Сообщение 2: Статья с кнопкой
-        await callback.message.answer(
-            "Супер! Вот твоя статья, приятного прочтения 🖤",
-            reply_markup=get_article_keyboard(ARTICLE_LINK)
-        )
+    if not is_subscribed:
+        return False
 
-        logger.info(f"Пользователь {user_id} подписался, выдаём материалы")
+    # Пользователь подписан
+    await db.update_user_subscription(user_id, is_subscribed=True)
 
-        # Запускаем отложенную отправку (5 мин + 30 сек)
-        asyncio.create_task(send_delayed_messages(callback.bot, user_id, db))
+    # Удаляем кнопки
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except TelegramBadRequest:
+        pass
+
+    # Запускаем отложенную отправку (5 мин + 30 сек). Если она уже
+    # запланирована, статья уже отправлена предыдущим нажатием
+    if not await schedule_delayed_messages(scheduler, user_id):
+        logger.info(f"Пользователь {user_id} уже получает материалы")
+        return True
+
+    # Сообщение 2: Статья с кнопкой
+    await callback.message.answer(
+        "Супер! Вот твоя статья, приятного прочтения 🖤",
+        reply_markup=get_article_keyboard(ARTICLE_LINK)
+    )
 
-    else:
-        # Не подписан
-        await callback.answer(
-            "❌ Вы еще не подписались на канал!\n\n"
-            "Подпишитесь и нажмите кнопку еще раз.",
-            show_alert=True,
-        )
-        logger.info(f"Пользователь {user_id} не прошёл проверку подписки")
+    logger.info(f"Пользователь {user_id} подписался, выдаём материалы")
+    return True
@@ -0,0 +1,154 @@
+"""
+Настройка логирования
+
+Записи из event loop только кладутся в очередь (QueueHandler),
+форматирование и запись на диск выполняет фоновый поток (QueueListener).
+Файл лога ротируется по размеру, формат - текст или JSON (по строке на запись).
+Для болтливых модулей (проверка подписки, БД) действует ограничение
+числа записей с одного места в коде за период.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Логгеры, для которых включается ограничение частоты записей
+RATE_LIMITED_LOGGERS = ("bot.utils.checks", "bot.database.db")
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше rate записей за period секунд с одного места в коде
+
+    Число пропущенных записей дописывается к первой записи
+    следующего периода. CRITICAL проходит всегда.
+    """
+
+    def __init__(self, rate: int, period: float = 60.0):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        # (файл, строка) -> [начало периода, записано, пропущено]
+        self._windows: Dict[Tuple[str, int], List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.period:
+            suppressed = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                self._append_suppressed(record, suppressed)
+
+        if window[1] >= self.rate:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+    @staticmethod
+    def _append_suppressed(record: logging.LogRecord, suppressed: int):
+        """
+        Дописать число пропущенных записей через args
+
+        Текст записи не собирается здесь, а "%" в нем не ломает подстановку.
+        """
+        note = " (пропущено похожих записей: %d)"
+        if isinstance(record.args, tuple) and record.args:
+            record.msg = f"{record.msg}{note}"
+            record.args = record.args + (suppressed,)
+        else:
+            # Без аргументов или с аргументами-словарем
+            record.msg, record.args = "%s" + note, (record.getMessage(), suppressed)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный prepare() собирает сообщение сразу; здесь запись
+    передается как есть, и аргументы подставляет поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    level: str = "INFO",
+    log_file: Optional[str] = "bot.log",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    json_format: bool = False,
+    rate_limit: int = 0,
+    rate_limited_loggers: Iterable[str] = RATE_LIMITED_LOGGERS,
+) -> logging.handlers.QueueListener:
+    """
+    Логирование через очередь и фоновый поток
+
+    Args:
+        level: уровень корневого логгера
+        log_file: файл лога (None - только stdout)
+        max_bytes: размер файла, после которого он ротируется
+        backup_count: сколько старых файлов хранить
+        json_format: писать записи в JSON
+        rate_limit: записей с одного места в минуту для rate_limited_loggers (0 - без ограничения)
+
+    Returns:
+        QueueListener: уже запущен, останавливается при выходе из процесса
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    if rate_limit:
+        rate_filter = RateLimitFilter(rate_limit)
+        for name in rate_limited_loggers:
+            logging.getLogger(name).addFilter(rate_filter)
+
+    listener.start()
+    # Дописываем очередь до конца при выходе
+    atexit.register(listener.stop)
+    return listener
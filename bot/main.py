@@ -3,49 +3,53 @@
 """
 import asyncio
 import logging
+import os
 import sys
-from aiogram import Bot, Dispatcher
+import time
+
+# Начало отсчета времени запуска (до импорта aiogram и остального кода)
+STARTED_AT = time.monotonic()
+
+from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
-from bot.config import config
+from bot.cluster import run_cluster
+from bot.config import BASE_DIR, config
 from bot.database import Database
-from bot.handlers import main_router
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("bot.log", encoding="utf-8")
-    ]
+from bot.dispatcher import create_dispatcher
+from bot.handlers.start import register_jobs
+from bot.log import setup_logging
+from bot.utils import (
+    JobScheduler,
+    AssetRegistry,
+    BroadcastEngine,
+    MetricsServer,
+    RetentionService,
 )
+from bot.utils.metrics import PENDING_JOBS, STARTUP_DURATION, instrument_database, registry
+from bot.webhook import run_webhook
 
-logger = logging.getLogger(__name__)
-
-
-async def on_startup(bot: Bot, db: Database):
-    """
-    Функция, которая выполняется при запуске бота
-    """
-    logger.info("🚀 Бот запускается...")
+# Настройка логирования (запись в файл и stdout - в фоновом потоке)
+setup_logging(
+    level=config.log_level,
+    log_file=config.log_file,
+    max_bytes=config.log_max_bytes,
+    backup_count=config.log_backup_count,
+    json_format=config.log_json,
+    rate_limit=config.log_rate_limit,
+)
 
-    # Подключаемся к базе данных
-    await db.connect()
+logger = logging.getLogger(__name__)
 
-    # Получаем информацию о боте
-    bot_info = await bot.get_me()
-    logger.info(f"✅ Бот запущен: @{bot_info.username}")
-    logger.info(f"📊 База данных: {config.database_path}")
+# Фоновые задачи запуска (ссылки, чтобы задачи не собрал сборщик мусора)
+_background_tasks = set()
 
-    # Проверяем PDF файл
-    import os
-    pdf_exists = os.path.exists(config.pdf_file_path)
-    logger.info(f"PDF путь: {config.pdf_file_path}")
-    logger.info(f"PDF существует: {pdf_exists}")
 
-    # Уведомляем администратора о запуске
+async def notify_admin_started(bot: Bot, bot_info, pdf_exists: bool):
+    """Уведомление администратора о запуске"""
     try:
         await bot.send_message(
             chat_id=config.admin_id,
@@ -59,12 +63,70 @@ async def on_startup(bot: Bot, db: Database):
         logger.warning(f"Не удалось отправить уведомление администратору: {e}")
 
 
-async def on_shutdown(bot: Bot, db: Database):
+async def on_startup(
+    bot: Bot,
+    db: Database,
+    scheduler: JobScheduler,
+    assets: AssetRegistry,
+    broadcaster: BroadcastEngine,
+    retention: RetentionService,
+):
+    """
+    Функция, которая выполняется при запуске бота
+    """
+    logger.info("🚀 Бот запускается...")
+
+    async def prepare_storage():
+        # Подключаемся к базе данных (миграции схемы - только если версия старая)
+        await db.connect()
+        # Хэшируем статические файлы и поднимаем сохраненные file_id
+        await assets.load()
+
+    # Запрос к Bot API и работа с диском идут параллельно
+    bot_info, pdf_exists, _ = await asyncio.gather(
+        bot.get_me(),
+        asyncio.to_thread(os.path.exists, config.pdf_file_path),
+        prepare_storage(),
+    )
+
+    # Запускаем планировщик отложенных сообщений
+    await scheduler.start()
+
+    # Продолжаем рассылки, прерванные перезапуском
+    await broadcaster.resume()
+
+    # Архивация старых сообщений
+    await retention.start()
+
+    logger.info(f"✅ Бот запущен: @{bot_info.username}")
+    logger.info(f"📊 База данных: {config.database_path}")
+    logger.info(f"BASE_DIR: {BASE_DIR}")
+    logger.info(f"PDF путь: {config.pdf_file_path}")
+    logger.info(f"PDF существует: {pdf_exists}")
+
+    # Уведомление администратору не задерживает прием обновлений
+    task = asyncio.create_task(notify_admin_started(bot, bot_info, pdf_exists))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def on_shutdown(
+    bot: Bot,
+    db: Database,
+    scheduler: JobScheduler,
+    broadcaster: BroadcastEngine,
+    retention: RetentionService,
+):
     """
     Функция, которая выполняется при остановке бота
     """
     logger.info("🛑 Бот останавливается...")
 
+    # Останавливаем планировщик и рассылки (задачи и прогресс останутся в БД)
+    await scheduler.stop()
+    await broadcaster.stop()
+    await retention.stop()
+
     # Отключаемся от базы данных
     await db.disconnect()
 
@@ -86,41 +148,110 @@ async def main():
     Главная функция для запуска бота
     """
     try:
-        # Создаем экземпляр бота
+        if config.cluster_workers:
+            # Несколько процессов-обработчиков (см. bot/cluster.py)
+            await run_cluster(config.cluster_workers)
+            return
+
+        # Создаем экземпляр бота (при необходимости - через свой Bot API сервер)
+        session = None
+        if config.telegram_api_url:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
         bot = Bot(
             token=config.bot_token,
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
 
-        # Создаем диспетчер
-        dp = Dispatcher()
+        # Создаем экземпляр базы данных
+        db = Database(
+            config.database_path,
+            read_pool_size=config.db_read_pool_size,
+            write_behind=config.db_write_behind,
+            flush_interval=config.db_flush_interval,
+            flush_max_ops=config.db_flush_max_ops,
+            user_cache_size=config.user_cache_size,
+            route_ttl=config.reply_route_ttl_days * 24 * 3600,
+            fsm_ttl=config.fsm_state_ttl_hours * 3600,
+        )
+        instrument_database(db)
+
+        # Планировщик отложенных сообщений
+        assets = AssetRegistry(db, config.static_dir)
+        scheduler = JobScheduler(bot, db, rate=config.job_rate)
+        register_jobs(scheduler, db, assets)
 
-        # Подключаем роутеры
-        dp.include_router(main_router)
+        # Движок рассылок
+        broadcaster = BroadcastEngine(
+            bot,
+            db,
+            rate=config.broadcast_rate,
+            concurrency=config.broadcast_concurrency,
+        )
 
-        # Создаем экземпляр базы данных
-        db = Database(config.database_path)
+        # Архивация старых сообщений
+        retention = RetentionService(
+            db,
+            retention_days=config.messages_retention_days,
+            batch_size=config.retention_batch_size,
+        )
+
+        # Создаем диспетчер: роутеры, middleware, метрики
+        services = {"db": db, "scheduler": scheduler, "broadcaster": broadcaster}
+        dp = create_dispatcher(bot, db, services, STARTED_AT)
+
+        async def collect_pending_jobs():
+            PENDING_JOBS.set(await db.count_pending_jobs())
+
+        registry.add_collector(collect_pending_jobs)
+
+        # /healthz отвечает 200, только когда бот полностью запущен
+        started = False
+
+        async def is_started() -> bool:
+            return started
+
+        async def is_scheduler_running() -> bool:
+            return scheduler.is_running
+
+        metrics_server = MetricsServer(
+            config.metrics_host,
+            config.metrics_port,
+            checks={
+                "startup": is_started,
+                "database": db.ping,
+                "scheduler": is_scheduler_running,
+            },
+        )
+        if config.metrics_port:
+            await metrics_server.start()
 
-        # Регистрируем middleware для передачи db в обработчики
-        @dp.update.outer_middleware()
-        async def db_middleware(handler, event, data):
-            """Middleware для передачи database в обработчики"""
-            data["db"] = db
-            return await handler(event, data)
+        # Запускаем функцию при старте; для polling параллельно снимаем
+        # вебхук и пропускаем накопившиеся обновления
+        startup = [on_startup(bot, db, scheduler, assets, broadcaster, retention)]
+        if config.bot_mode != "webhook":
+            startup.append(bot.delete_webhook(drop_pending_updates=True))
+        await asyncio.gather(*startup)
+        started = True
 
-        # Запускаем функцию при старте
-        await on_startup(bot, db)
+        startup_duration = time.monotonic() - STARTED_AT
+        STARTUP_DURATION.set(startup_duration)
+        logger.info(f"⏱ Запуск занял {startup_duration:.3f} сек")
 
-        # Запускаем polling (бесконечный опрос обновлений)
         try:
-            await dp.start_polling(
-                bot,
-                allowed_updates=dp.resolve_used_update_types(),
-                drop_pending_updates=True  # Пропускаем накопившиеся обновления
-            )
+            if config.bot_mode == "webhook":
+                # Прием обновлений через вебхук (aiohttp сервер)
+                await run_webhook(bot, dp)
+            else:
+                # Запускаем polling (бесконечный опрос обновлений)
+                await dp.start_polling(
+                    bot,
+                    allowed_updates=dp.resolve_used_update_types(),
+                )
         finally:
             # Выполняем при остановке
-            await on_shutdown(bot, db)
+            await on_shutdown(bot, db, scheduler, broadcaster, retention)
+            await metrics_server.stop()
             await bot.session.close()
 
     except Exception as e:
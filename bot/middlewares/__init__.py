@@ -0,0 +1,13 @@
+"""
+Middleware диспетчера и HTTP-сессии бота
+"""
+from .metrics import HandlerMetricsMiddleware, ApiMetricsMiddleware, FirstUpdateMiddleware
+from .throttling import ThrottlingMiddleware, TokenBuckets
+
+__all__ = [
+    "HandlerMetricsMiddleware",
+    "ApiMetricsMiddleware",
+    "FirstUpdateMiddleware",
+    "ThrottlingMiddleware",
+    "TokenBuckets",
+]
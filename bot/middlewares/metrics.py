@@ -0,0 +1,98 @@
+"""
+Сбор метрик: время обработчиков и запросов к Telegram Bot API
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from bot.utils.metrics import (
+    API_ERRORS,
+    API_LATENCY,
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    TIME_TO_FIRST_UPDATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """
+    Время от старта процесса до первого обновления (outer middleware на update)
+
+    started_at - time.monotonic() в начале запуска процесса.
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.seen = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self.seen:
+            self.seen = True
+            elapsed = time.monotonic() - self.started_at
+            TIME_TO_FIRST_UPDATE.set(elapsed)
+            logger.info(f"Первое обновление через {elapsed:.3f} сек после старта")
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время выполнения каждого обработчика
+
+    Регистрируется как inner middleware: к этому моменту фильтры
+    пройдены и в data["handler"] лежит выбранный обработчик.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время запросов к Bot API и число ошибок (в том числе 429)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramAPIError as e:
+            API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, method=name)
@@ -0,0 +1,162 @@
+"""
+Ограничение частоты обновлений от одного пользователя (token bucket)
+
+Корзины пользователей лежат в трех массивах фиксированного размера
+(открытая адресация): память не растет с числом пользователей.
+Корзина, которая успела наполниться до burst, ничем не отличается
+от новой, поэтому ее ячейку можно отдать другому пользователю.
+"""
+import asyncio
+import logging
+import math
+import time
+from array import array
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from bot.utils.metrics import THROTTLED_UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Множитель хэширования Фибоначчи (2^64 / золотое сечение)
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class TokenBuckets:
+    """
+    Token bucket на каждый ключ в таблице из slots ячеек
+
+    Ключ ищется в окне из probes ячеек после его хэша. Если в окне нет
+    ни ключа, ни свободной ячейки, вытесняется ячейка, к которой дольше
+    всего не обращались (ее владелец потом получит полную корзину).
+    """
+
+    def __init__(self, rate: float, burst: float, slots: int = 65536, probes: int = 8):
+        self.rate = rate
+        self.burst = burst
+        self.probes = probes
+
+        bits = max(int(math.ceil(math.log2(max(slots, probes)))), 1)
+        self._shift = 64 - bits
+        self._mask = (1 << bits) - 1
+
+        size = 1 << bits
+        # Ключ 0 - свободная ячейка
+        self._keys = array("q", bytes(8 * size))
+        self._tokens = array("d", bytes(8 * size))
+        self._stamps = array("d", bytes(8 * size))
+        # За это время пустая корзина наполняется до burst
+        self._refill_time = burst / rate
+
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _slot(self, key: int, now: float) -> int:
+        start = ((key * _HASH_MULTIPLIER) & _MASK64) >> self._shift
+        free = -1
+        oldest = -1
+        oldest_stamp = math.inf
+
+        for i in range(self.probes):
+            slot = (start + i) & self._mask
+            slot_key = self._keys[slot]
+            if slot_key == key:
+                return slot
+            stamp = self._stamps[slot]
+            if free < 0 and (slot_key == 0 or now - stamp >= self._refill_time):
+                free = slot
+            if stamp < oldest_stamp:
+                oldest, oldest_stamp = slot, stamp
+
+        if free < 0:
+            free = oldest
+            self.evictions += 1
+        self._keys[free] = key
+        self._tokens[free] = self.burst
+        self._stamps[free] = now
+        return free
+
+    def acquire(self, key: int, max_delay: float = 0.0, now: Optional[float] = None) -> Optional[float]:
+        """
+        Взять токен для key
+
+        Returns:
+            float: через сколько секунд можно продолжать (0 - сразу)
+            None: токена не будет и за max_delay - событие отбрасывается
+        """
+        now = time.monotonic() if now is None else now
+        slot = self._slot(key, now)
+
+        tokens = min(self.burst, self._tokens[slot] + (now - self._stamps[slot]) * self.rate)
+        self._stamps[slot] = now
+
+        if tokens >= 1:
+            self._tokens[slot] = tokens - 1
+            return 0.0
+
+        delay = (1 - tokens) / self.rate
+        if delay > max_delay:
+            self._tokens[slot] = tokens
+            return None
+
+        # Токен берется в долг: следующие события ждут дольше
+        self._tokens[slot] = tokens - 1
+        return delay
+
+
+def is_unthrottled(event: TelegramObject) -> bool:
+    """Изменение состава чата или часть альбома"""
+    if not isinstance(event, Update):
+        return False
+    if event.chat_member is not None or event.my_chat_member is not None:
+        return True
+    return event.message is not None and event.message.media_group_id is not None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer middleware на update: лишние обновления пользователя
+    задерживаются (не дольше max_delay) или отбрасываются до фильтров
+    и обработчиков. Администратор не ограничивается.
+
+    Не ограничиваются и обновления, потеря которых ломает данные:
+    chat_member/my_chat_member (зеркало участников канала) и части
+    альбомов (пересланное сообщение лишилось бы части медиа).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_delay: float = 1.0,
+        slots: int = 65536,
+        exempt: tuple = (),
+    ):
+        self.buckets = TokenBuckets(rate, burst, slots=slots)
+        self.max_delay = max_delay
+        self.exempt = frozenset(exempt)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is None or user.id in self.exempt or is_unthrottled(event):
+            return await handler(event, data)
+
+        delay = self.buckets.acquire(user.id, self.max_delay)
+        if delay is None:
+            THROTTLED_UPDATES.inc(action="dropped")
+            logger.debug("Обновление от %s отброшено (flood)", user.id)
+            return None
+        if delay:
+            THROTTLED_UPDATES.inc(action="delayed")
+            await asyncio.sleep(delay)
+        return await handler(event, data)
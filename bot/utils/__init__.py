@@ -1,6 +1,25 @@
 """
 Утилиты для бота
 """
-from .checks import check_user_subscription
+from bot.cache import TTLCache
+from .checks import check_user_subscription, subscription_cache
+from .scheduler import JobScheduler
+from .assets import AssetRegistry
+from .broadcast import BroadcastEngine
+from .metrics import MetricsServer
+from .retention import RetentionService
+from .singleflight import SingleFlight
+from .media_group import MediaGroupCollector
 
-__all__ = ["check_user_subscription"]
+__all__ = [
+    "TTLCache",
+    "check_user_subscription",
+    "subscription_cache",
+    "JobScheduler",
+    "AssetRegistry",
+    "BroadcastEngine",
+    "MetricsServer",
+    "RetentionService",
+    "SingleFlight",
+    "MediaGroupCollector",
+]
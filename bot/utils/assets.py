@@ -0,0 +1,175 @@
+"""
+Реестр статических файлов с кэшем file_id
+
+Каждый файл из static/ загружается в Telegram один раз, полученный
+file_id сохраняется в БД вместе с sha256 содержимого. Дальше файл
+отправляется по file_id. При изменении содержимого файл загружается заново.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Ответы Bot API, после которых сохраненный file_id нужно загрузить заново
+_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "wrong file_id",
+)
+
+
+def _is_file_id_error(error: TelegramBadRequest) -> bool:
+    """Ошибка из-за самого file_id (а не чата, текста и т.п.)"""
+    message = error.message.lower()
+    return any(marker in message for marker in _FILE_ID_ERRORS)
+
+
+def _file_sha256(path: str) -> str:
+    """sha256 содержимого файла"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class _Asset:
+    """Состояние одного файла"""
+
+    __slots__ = ("path", "sha256", "file_id", "mtime_ns", "size", "checked_at")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sha256: Optional[str] = None
+        self.file_id: Optional[str] = None
+        self.mtime_ns = 0
+        self.size = 0
+        self.checked_at = 0.0
+
+
+class AssetRegistry:
+    """Отправка статических файлов по кэшированному file_id"""
+
+    def __init__(self, db: Database, static_dir: str, revalidate_interval: float = 60):
+        self.db = db
+        self.static_dir = os.path.abspath(static_dir)
+        self.revalidate_interval = revalidate_interval
+
+        self._assets: Dict[str, _Asset] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _key(self, path: str) -> str:
+        """Ключ файла: путь относительно static/ (или абсолютный)"""
+        path = os.path.abspath(path)
+        if os.path.commonpath([path, self.static_dir]) == self.static_dir:
+            return os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+        return path
+
+    async def load(self):
+        """Хэширование файлов static/ и загрузка сохраненных file_id"""
+        stored = await self.db.get_assets()
+
+        paths = []
+        for root, _, files in os.walk(self.static_dir):
+            paths.extend(os.path.join(root, name) for name in files)
+
+        for path in paths:
+            asset = await self._refresh(path)
+            if asset is None:
+                continue
+            record = stored.get(self._key(path))
+            if record and record["sha256"] == asset.sha256:
+                asset.file_id = record["file_id"]
+
+        cached = sum(1 for asset in self._assets.values() if asset.file_id)
+        logger.info(f"Статических файлов: {len(self._assets)}, с file_id: {cached}")
+
+    async def _refresh(self, path: str) -> Optional[_Asset]:
+        """Проверка файла на диске и пересчет хэша при изменении"""
+        key = self._key(path)
+        asset = self._assets.get(key)
+        if asset is None:
+            asset = self._assets[key] = _Asset(os.path.abspath(path))
+
+        try:
+            stat = os.stat(asset.path)
+        except FileNotFoundError:
+            self._assets.pop(key, None)
+            return None
+
+        asset.checked_at = time.monotonic()
+        if asset.sha256 and (stat.st_mtime_ns, stat.st_size) == (asset.mtime_ns, asset.size):
+            return asset
+
+        sha256 = await asyncio.to_thread(_file_sha256, asset.path)
+        if asset.sha256 != sha256:
+            if asset.sha256:
+                logger.info(f"Файл {key} изменился, будет загружен заново")
+            asset.sha256 = sha256
+            asset.file_id = None
+        asset.mtime_ns, asset.size = stat.st_mtime_ns, stat.st_size
+        return asset
+
+    async def _get(self, path: str) -> Optional[_Asset]:
+        """Файл из реестра, с периодической перепроверкой на диске"""
+        asset = self._assets.get(self._key(path))
+        if asset and time.monotonic() - asset.checked_at < self.revalidate_interval:
+            return asset
+        return await self._refresh(path)
+
+    async def send_document(self, bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+        """
+        Отправка файла как документа
+
+        Raises:
+            FileNotFoundError: если файла нет на диске
+            TelegramBadRequest: ошибки, не связанные с file_id (чат не найден и т.п.)
+        """
+        asset = await self._get(path)
+        if asset is None:
+            raise FileNotFoundError(path)
+
+        key = self._key(path)
+        message = await self._send_cached(bot, chat_id, key, asset, **kwargs)
+        if message is not None:
+            return message
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Пока ждали блокировку, файл мог загрузить другой запрос
+            message = await self._send_cached(bot, chat_id, key, asset, **kwargs)
+            if message is not None:
+                return message
+
+            message = await bot.send_document(
+                chat_id=chat_id, document=FSInputFile(asset.path), **kwargs
+            )
+            if message.document:
+                asset.file_id = message.document.file_id
+                await self.db.save_asset(key, asset.sha256, asset.file_id)
+                logger.info(f"Файл {key} загружен, file_id сохранен")
+            return message
+
+    async def _send_cached(
+        self, bot: Bot, chat_id: int, key: str, asset: _Asset, **kwargs
+    ) -> Optional[Message]:
+        """Отправка по file_id; None - file_id нет или он недействителен"""
+        if not asset.file_id:
+            return None
+        try:
+            return await bot.send_document(chat_id=chat_id, document=asset.file_id, **kwargs)
+        except TelegramBadRequest as e:
+            # Чат не найден, ошибка разметки и т.п.: загрузка файла не поможет
+            if not _is_file_id_error(e):
+                raise
+            logger.warning(f"file_id для {key} недействителен: {e}")
+            asset.file_id = None
+            return None
@@ -0,0 +1,301 @@
+"""
+Движок рассылок с учетом лимитов Telegram
+
+- глобальный token bucket (~30 сообщений/сек у Telegram, берем с запасом)
+- несколько параллельных отправителей
+- при TelegramRetryAfter вся рассылка делает паузу и снижает скорость,
+  затем постепенно возвращается к базовой
+- прогресс по каждому получателю хранится в БД, поэтому прерванная
+  рассылка продолжается после перезапуска с места остановки
+- сообщение администратора любого типа (и альбом) копируется получателям
+  через copyMessage/copyMessages: файлы не загружаются заново, форматирование
+  сохраняется, на получателя - один запрос
+"""
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from bot.database import Database, Segment
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket с адаптивной скоростью"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: float = 1.0):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity if capacity is not None else rate
+
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Ожидание одного токена"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def penalize(self, retry_after: float):
+        """Пауза на retry_after и снижение скорости (TelegramRetryAfter)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + retry_after)
+        self.rate = max(self.min_rate, self.rate * 0.7)
+        self._tokens = 0
+        self._updated_at = now
+
+    def reward(self):
+        """Постепенное восстановление скорости после успешной отправки"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + 0.05)
+
+
+class BroadcastEngine:
+    """Рассылки с ограничением скорости и сохранением прогресса"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        db: Database,
+        rate: float = 25,
+        concurrency: int = 10,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        progress_interval: float = 10.0,
+        max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.progress_interval = progress_interval
+        self.max_attempts = max_attempts
+
+        self.bucket = TokenBucket(rate)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def start(
+        self,
+        admin_chat_id: int,
+        text: str,
+        from_chat_id: Optional[int] = None,
+        message_ids: Sequence[int] = (),
+        segment: Optional[Segment] = None,
+    ) -> int:
+        """
+        Создание и запуск рассылки. Возвращает число получателей
+
+        Если переданы message_ids, получателям копируются эти сообщения
+        чата from_chat_id, а text только подписывает рассылку в БД.
+        Получатели - пользователи из segment (без него - все).
+        """
+        broadcast = await self.db.create_broadcast(
+            admin_chat_id, text, from_chat_id, list(message_ids), segment
+        )
+        if broadcast is None:
+            return 0
+        if not broadcast["total"]:
+            await self.db.finish_broadcast(broadcast["id"])
+            return 0
+
+        self._launch(broadcast)
+        return broadcast["total"]
+
+    async def resume(self):
+        """Продолжение рассылок, прерванных перезапуском"""
+        for broadcast in await self.db.get_running_broadcasts():
+            if broadcast["id"] not in self._tasks:
+                logger.info(f"Продолжаю рассылку {broadcast['id']}")
+                self._launch(broadcast)
+
+    async def stop(self):
+        """Остановка рассылок (прогресс уже в БД)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _launch(self, broadcast: Dict):
+        task = asyncio.create_task(self._run(broadcast))
+        self._tasks[broadcast["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast["id"], None))
+
+    def _sender(
+        self, broadcast: Dict, messages: List[Dict[str, Any]]
+    ) -> Tuple[Callable[..., Awaitable[Any]], int]:
+        """Отправка рассылки одному получателю (chat_id=...) и ее цена в токенах"""
+        if not messages:
+            # Рассылки, созданные до копирования сообщений
+            return partial(self.bot.send_message, text=broadcast["text"]), 1
+        if len(messages) == 1:
+            return partial(
+                self.bot.copy_message,
+                from_chat_id=messages[0]["from_chat_id"],
+                message_id=messages[0]["message_id"],
+            ), 1
+        # Альбом уходит одним запросом, но лимит Telegram считает каждое сообщение
+        return partial(
+            self.bot.copy_messages,
+            from_chat_id=messages[0]["from_chat_id"],
+            message_ids=[message["message_id"] for message in messages],
+        ), len(messages)
+
+    async def _run(self, broadcast: Dict):
+        """Выполнение одной рассылки"""
+        broadcast_id = broadcast["id"]
+        admin_chat_id = broadcast["admin_chat_id"]
+        done_before = broadcast["sent"] + broadcast["failed"]
+        resumed = done_before > 0
+
+        results: List[Tuple[int, bool]] = []
+        counters = {"sent": broadcast["sent"], "failed": broadcast["failed"]}
+        started_at = time.monotonic()
+
+        status_message = await self._notify(
+            admin_chat_id,
+            (f"📢 Продолжаю рассылку #{broadcast_id} после перезапуска "
+             f"({done_before}/{broadcast['total']})..." if resumed else
+             f"📢 Начинаю рассылку для {broadcast['total']} пользователей..."),
+        )
+
+        send, cost = self._sender(broadcast, await self.db.get_broadcast_messages(broadcast_id))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                if user_id is None:
+                    return
+                ok = await self._send(user_id, send, cost)
+                results.append((user_id, ok))
+                counters["sent" if ok else "failed"] += 1
+
+        async def flush():
+            if results:
+                batch = results[:]
+                results.clear()
+                await self.db.save_broadcast_results(broadcast_id, batch)
+
+        async def reporter():
+            last_report = time.monotonic()
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await flush()
+                if status_message and time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await self._edit_progress(
+                        status_message, broadcast, counters, done_before, started_at
+                    )
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        reporter_task = asyncio.create_task(reporter())
+        try:
+            async for user_id in self.db.iter_pending_recipients(
+                broadcast_id, self.batch_size
+            ):
+                await queue.put(user_id)
+
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            reporter_task.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(reporter_task, *workers, return_exceptions=True)
+            # Сохраняем то, что успели отправить, в том числе при отмене
+            await asyncio.shield(flush())
+
+        await self.db.finish_broadcast(broadcast_id)
+
+        elapsed = time.monotonic() - started_at
+        processed = counters["sent"] + counters["failed"] - done_before
+        rate = processed / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"Рассылка {broadcast_id} завершена: успешно {counters['sent']}, "
+            f"ошибок {counters['failed']}, {rate:.1f} сообщ./сек"
+        )
+        await self._notify(
+            admin_chat_id,
+            f"✅ <b>Рассылка завершена</b>\n\n"
+            f"Успешно: {counters['sent']}\n"
+            f"Ошибок: {counters['failed']}\n"
+            f"Скорость: {rate:.1f} сообщ./сек",
+        )
+
+    async def _send(
+        self, user_id: int, send: Callable[..., Awaitable[Any]], cost: int = 1
+    ) -> bool:
+        """Отправка одному получателю с учетом лимитов"""
+        for attempt in range(1, self.max_attempts + 1):
+            for _ in range(cost):
+                await self.bucket.acquire()
+            try:
+                await send(chat_id=user_id)
+                self.bucket.reward()
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Лимит Telegram, пауза {e.retry_after} сек")
+                self.bucket.penalize(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+                logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+                return False
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Сетевая ошибка при отправке пользователю {user_id}: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+                return False
+        return False
+
+    async def _notify(self, chat_id: int, text: str):
+        """Сообщение администратору"""
+        try:
+            return await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+        except Exception as e:
+            logger.warning(f"Не удалось отправить статус рассылки: {e}")
+            return None
+
+    async def _edit_progress(self, status_message, broadcast, counters, done_before, started_at):
+        """Обновление сообщения с прогрессом"""
+        done = counters["sent"] + counters["failed"]
+        elapsed = time.monotonic() - started_at
+        rate = (done - done_before) / elapsed if elapsed > 0 else 0
+        try:
+            await status_message.edit_text(
+                f"📢 Рассылка #{broadcast['id']}: {done}/{broadcast['total']}\n\n"
+                f"Успешно: {counters['sent']}\n"
+                f"Ошибок: {counters['failed']}\n"
+                f"Скорость: {rate:.1f} сообщ./сек"
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки: {e}")
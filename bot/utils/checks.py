@@ -2,55 +2,133 @@
 Утилиты для проверок
 """
 import logging
+import time
+from functools import partial
+from typing import Any, Dict, Optional
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 
+from bot.cache import TTLCache
+from bot.config import config
+from bot.database import Database
+from .singleflight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Статусы участника канала, которые считаются подпиской
+# (left - вышел, kicked - забанен, restricted - ограничен)
+SUBSCRIBED_STATUSES = ("creator", "administrator", "member")
+
+# Кэш результатов проверки подписки: (channel_id, user_id) -> bool
+subscription_cache = TTLCache(maxsize=config.subscription_cache_size)
+
+# Одновременные проверки одного пользователя делают один запрос getChatMember
+_subscription_checks = SingleFlight("get_chat_member")
+
+_MISSING = object()
+
 
-async def check_user_subscription(bot: Bot, user_id: int, channel_id: str) -> bool:
+def member_status(status: Any) -> str:
+    """Статус участника строкой (в aiogram это ChatMemberStatus)"""
+    return getattr(status, "value", status)
+
+
+def _mirror_answer(row: Dict[str, Any]) -> Optional[bool]:
+    """
+    Ответ по зеркалу участников канала (None - запись устарела)
+
+    Подписка и выход из канала, пришедшие событием chat_member, верны
+    CHANNEL_MIRROR_TTL_HOURS. Отказ из getChatMember живет как в кэше -
+    подписку без события (бот не получает chat_member) иначе не увидеть.
+    """
+    subscribed = row["status"] in SUBSCRIBED_STATUSES
+    trusted = subscribed or row["source"] == "update"
+    max_age = config.channel_mirror_ttl_hours * 3600 if trusted else config.subscription_cache_negative_ttl
+    if time.time() - row["updated_at"] >= max_age:
+        return None
+    return subscribed
+
+
+async def check_user_subscription(
+    bot: Bot, user_id: int, channel_id: str, db: Optional[Database] = None
+) -> bool:
     """
     Проверка подписки пользователя на канал
 
+    Порядок: кэш в памяти, зеркало участников канала в БД (если передан db,
+    пополняется событиями chat_member), запрос getChatMember.
+    Результат кэшируется: положительный на SUBSCRIPTION_CACHE_TTL,
+    отрицательный на SUBSCRIPTION_CACHE_NEGATIVE_TTL секунд.
+    Ошибки API не кэшируются. Одновременные вызовы для одного
+    пользователя ждут один общий запрос.
+
     Args:
         bot: Экземпляр бота
         user_id: ID пользователя в Telegram
         channel_id: ID или @username канала
+        db: база с зеркалом участников канала
 
     Returns:
         bool: True если подписан, False если нет
     """
-    try:
-        logger.info(f"🔍 Проверяю подписку: user_id={user_id}, channel_id={channel_id}")
+    key = (channel_id, user_id)
+    cached = subscription_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    if db is not None:
+        row = await db.get_channel_member(channel_id, user_id)
+        subscribed = _mirror_answer(row) if row else None
+        if subscribed is not None:
+            trusted = subscribed or row["source"] == "update"
+            ttl = config.subscription_cache_ttl if trusted else config.subscription_cache_negative_ttl
+            subscription_cache.set(key, subscribed, ttl=ttl)
+            return subscribed
 
+    return await _subscription_checks.do(
+        key, partial(_fetch_subscription, bot, user_id, channel_id, db)
+    )
+
+
+async def _fetch_subscription(
+    bot: Bot, user_id: int, channel_id: str, db: Optional[Database] = None
+) -> bool:
+    """Запрос статуса в канале и запись результата в кэш и зеркало"""
+    key = (channel_id, user_id)
+    try:
         # Получаем информацию о пользователе в канале
         member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+        status = member_status(member.status)
+        if db is not None:
+            await db.save_channel_member(channel_id, user_id, status, source="api")
 
-        # Логируем статус для отладки
-        logger.info(f"📊 Статус пользователя {user_id} в канале: {member.status}")
-
-        # Проверяем статус
-        # creator - создатель, administrator - админ, member - участник
-        # left - вышел, kicked - забанен, restricted - ограничен
-        if member.status in ["creator", "administrator", "member"]:
-            logger.info(f"✅ Пользователь {user_id} подписан на канал {channel_id} (статус: {member.status})")
+        # Логи с подстановкой %s: строка собирается, только если запись пишется
+        if status in SUBSCRIBED_STATUSES:
+            logger.info(
+                "✅ Пользователь %s подписан на канал %s (статус: %s)",
+                user_id, channel_id, status,
+            )
+            subscription_cache.set(key, True, ttl=config.subscription_cache_ttl)
             return True
         else:
-            logger.info(f"❌ Пользователь {user_id} НЕ подписан на канал {channel_id} (статус: {member.status})")
+            logger.info(
+                "❌ Пользователь %s НЕ подписан на канал %s (статус: %s)",
+                user_id, channel_id, status,
+            )
+            subscription_cache.set(key, False, ttl=config.subscription_cache_negative_ttl)
             return False
 
     except TelegramBadRequest as e:
-        logger.error(f"❌ Ошибка проверки подписки (Bad Request):")
-        logger.error(f"   User ID: {user_id}")
-        logger.error(f"   Channel ID: {channel_id}")
-        logger.error(f"   Ошибка: {e}")
-        logger.error(f"   Возможные причины:")
-        logger.error(f"   1. Бот НЕ добавлен в администраторы канала")
-        logger.error(f"   2. Неверный CHANNEL_ID в .env")
-        logger.error(f"   3. У бота нет права 'Просмотр сообщений' в канале")
+        logger.error(
+            "❌ Ошибка проверки подписки (Bad Request): user_id=%s, channel_id=%s: %s. "
+            "Возможные причины: бот не администратор канала, неверный CHANNEL_ID в .env, "
+            "у бота нет права 'Просмотр сообщений'",
+            user_id, channel_id, e,
+        )
         return False
     except Exception as e:
-        logger.error(f"❌ Неожиданная ошибка проверки подписки: {e}")
-        logger.error(f"   User ID: {user_id}")
-        logger.error(f"   Channel ID: {channel_id}")
+        logger.error(
+            "❌ Неожиданная ошибка проверки подписки: user_id=%s, channel_id=%s: %s",
+            user_id, channel_id, e,
+        )
         return False
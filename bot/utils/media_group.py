@@ -0,0 +1,48 @@
+"""
+Сбор альбомов (media_group_id) из отдельных сообщений
+
+Telegram присылает каждое фото альбома отдельным обновлением. Сообщения
+группы копятся, пока после последнего не пройдет delay секунд, затем
+весь альбом передается в on_complete. Обработчик сообщения не ждет
+таймер, поэтому сбор работает и при последовательной обработке
+обновлений одного пользователя.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGroupCollector:
+    """Склейка сообщений одного альбома с задержкой"""
+
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self._groups: Dict[str, List[Message]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def add(self, message: Message, on_complete: Callable[[List[Message]], Awaitable[Any]]):
+        """Добавить сообщение альбома; on_complete последнего вызова получит весь альбом"""
+        group_id = message.media_group_id
+        self._groups.setdefault(group_id, []).append(message)
+
+        timer = self._timers.get(group_id)
+        if timer is not None:
+            timer.cancel()
+        self._timers[group_id] = asyncio.create_task(self._complete(group_id, on_complete))
+
+    async def _complete(self, group_id: str, on_complete: Callable[[List[Message]], Awaitable[Any]]):
+        await asyncio.sleep(self.delay)
+        self._timers.pop(group_id, None)
+        # Обновления могли прийти не по порядку
+        messages = sorted(self._groups.pop(group_id, []), key=lambda message: message.message_id)
+        try:
+            await on_complete(messages)
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {group_id}: {e}")
@@ -0,0 +1,357 @@
+"""
+Метрики в текстовом формате Prometheus
+
+Реестр счетчиков/гистограмм в памяти процесса и aiohttp сервер
+с двумя эндпоинтами:
+- /metrics - метрики для Prometheus
+- /healthz - проверка готовности (БД отвечает, планировщик работает)
+"""
+import functools
+import inspect
+import json
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию (секунды), как в клиенте Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Collector = Callable[[], Awaitable[None]]
+ReadinessCheck = Callable[[], Awaitable[bool]]
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовая метрика с метками"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels: str):
+        """Значение счетчика, который ведется в другом месте (для сборщиков)"""
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам"""
+
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики корзин..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            # Корзины в Prometheus накопительные, +Inf равна общему количеству
+            cumulative = 0
+            counts = state[:len(self.buckets)] + [state[-1]]
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative = count if math.isinf(bound) else cumulative + count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def add_collector(self, collector: Collector):
+        """Функция, обновляющая метрики перед каждой выдачей (например, gauge из БД)"""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.warning(f"Ошибка сбора метрик: {e}")
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# Реестр процесса и метрики бота
+registry = MetricsRegistry()
+
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_duration_seconds",
+    "Время выполнения обработчиков обновлений",
+    ("handler",),
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total",
+    "Необработанные исключения в обработчиках",
+    ("handler",),
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "bot_db_query_duration_seconds",
+    "Время выполнения методов Database",
+    ("method",),
+)
+API_LATENCY = registry.histogram(
+    "bot_telegram_api_duration_seconds",
+    "Время запросов к Telegram Bot API",
+    ("method",),
+)
+API_ERRORS = registry.counter(
+    "bot_telegram_api_errors_total",
+    "Ошибки запросов к Telegram Bot API (error=TelegramRetryAfter - ответы 429)",
+    ("method", "error"),
+)
+THROTTLED_UPDATES = registry.counter(
+    "bot_throttled_updates_total",
+    "Обновления сверх лимита частоты пользователя (action=delayed|dropped)",
+    ("action",),
+)
+SINGLEFLIGHT_SHARED = registry.counter(
+    "bot_singleflight_shared_total",
+    "Вызовы, присоединившиеся к уже выполняющемуся с тем же ключом",
+    ("name",),
+)
+PENDING_JOBS = registry.gauge(
+    "bot_scheduled_jobs_pending",
+    "Отложенные задачи в очереди",
+)
+CACHE_HITS = registry.counter(
+    "bot_cache_hits_total",
+    "Попадания в кэши в памяти",
+    ("cache",),
+)
+CACHE_MISSES = registry.counter(
+    "bot_cache_misses_total",
+    "Промахи кэшей в памяти",
+    ("cache",),
+)
+CACHE_EVICTIONS = registry.counter(
+    "bot_cache_evictions_total",
+    "Записи, вытесненные из кэшей при переполнении",
+    ("cache",),
+)
+CACHE_SIZE = registry.gauge(
+    "bot_cache_entries",
+    "Записей в кэшах в памяти",
+    ("cache",),
+)
+STARTUP_DURATION = registry.gauge(
+    "bot_startup_duration_seconds",
+    "От старта процесса до готовности принимать обновления",
+)
+TIME_TO_FIRST_UPDATE = registry.gauge(
+    "bot_time_to_first_update_seconds",
+    "От старта процесса до начала обработки первого обновления",
+)
+
+
+def cache_collector(caches: Dict[str, Any]) -> Collector:
+    """
+    Сборщик счетчиков кэшей TTLCache (None - кэш выключен)
+
+    Имя кэша в словаре становится меткой cache.
+    """
+
+    async def collect():
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            stats = cache.stats()
+            CACHE_HITS.set(stats["hits"], cache=name)
+            CACHE_MISSES.set(stats["misses"], cache=name)
+            CACHE_EVICTIONS.set(stats["evictions"], cache=name)
+            CACHE_SIZE.set(stats["size"], cache=name)
+
+    return collect
+
+
+def instrument_database(db, histogram: Histogram = DB_QUERY_LATENCY):
+    """
+    Замер времени всех публичных async-методов экземпляра Database
+
+    Методы подменяются на экземпляре, класс не меняется.
+    """
+    for name, method in inspect.getmembers(db, inspect.iscoroutinefunction):
+        if name.startswith("_"):
+            continue
+
+        @functools.wraps(method)
+        async def timed(*args, _method=method, _name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await _method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, method=_name)
+
+        setattr(db, name, timed)
+
+
+class MetricsServer:
+    """HTTP сервер метрик и проверки готовности"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        metrics: MetricsRegistry = registry,
+        checks: Optional[Dict[str, ReadinessCheck]] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.checks = checks or {}
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        app.router.add_get("/healthz", self._handle_health)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        body = await self.metrics.render()
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        results = {}
+        for name, check in self.checks.items():
+            try:
+                results[name] = bool(await check())
+            except Exception as e:
+                logger.warning(f"Проверка готовности {name} упала: {e}")
+                results[name] = False
+
+        status = 200 if all(results.values()) else 503
+        return web.Response(
+            text=json.dumps(results), status=status, content_type="application/json"
+        )
@@ -0,0 +1,73 @@
+"""
+Хранение сообщений: перенос старых сообщений в сжатый архив
+
+Раз в interval секунд сообщения старше retention_days дней переносятся
+из messages в messages_archive (текст сжат zlib) небольшими пачками,
+после чего освободившееся место возвращается файлу БД (incremental_vacuum).
+Заодно удаляются устаревшие маршруты ответов администратора
+и брошенные состояния FSM.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """Фоновая архивация старых сообщений и очистка устаревших записей"""
+
+    def __init__(
+        self,
+        db: Database,
+        retention_days: float,
+        batch_size: int = 500,
+        interval: float = 3600,
+    ):
+        self.db = db
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запуск фоновой задачи (retention_days = 0 - архивация выключена)"""
+        self._task = asyncio.create_task(self._run())
+        if self.retention_days > 0:
+            logger.info(f"Архивация сообщений старше {self.retention_days} дн. включена")
+        else:
+            logger.info("Архивация сообщений выключена")
+
+    async def stop(self):
+        """Остановка фоновой задачи"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Один проход: архивация, очистка устаревших записей и возврат свободного места"""
+        moved = 0
+        if self.retention_days > 0:
+            moved = await self.db.archive_messages(self.retention_days, self.batch_size)
+        purged = await self.db.purge_reply_routes()
+        purged += await self.db.purge_fsm_records()
+        if moved or purged:
+            await self.db.incremental_vacuum()
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка архивации сообщений: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,182 @@
+"""
+Планировщик отложенных задач с хранением в SQLite
+
+Задачи лежат в таблице scheduled_jobs и переживают перезапуск бота.
+Один цикл-диспетчер спит до ближайшей задачи (индекс по run_at),
+захватывает наступившие задачи пачками и выполняет их.
+В памяти держится только текущая пачка, а не все ожидающие задачи.
+В кластерном режиме у каждого воркера свой планировщик, который
+захватывает только задачи своего шарда (user_id % число воркеров).
+
+Задачи отправляют сообщения не быстрее rate в секунду (token bucket,
+как у рассылок): после перезапуска или наплыва /start пачка не уходит
+в Telegram разом. Ответ 429 ставит отправку на паузу и снижает скорость.
+
+Обработчик сообщает об ошибке исключением: задача повторяется с
+нарастающей паузой (не меньше retry_after из ответа 429), пока не
+кончатся попытки. Постоянные ошибки обработчик обрабатывает сам.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.database import Database
+from .broadcast import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Bot, int], Awaitable[None]]
+
+
+class JobScheduler:
+    """Диспетчер отложенных задач"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        db: Database,
+        batch_size: int = 100,
+        max_attempts: int = 3,
+        retry_delay: float = 60,
+        idle_timeout: float = 60,
+        poll_interval: float = 1.0,
+        rate: float = 10,
+        shard: Optional[Tuple[int, int]] = None,
+    ):
+        self.bot = bot
+        self.db = db
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        # Пауза, если наступившие задачи успел захватить другой процесс
+        self.poll_interval = poll_interval
+        # (номер воркера, число воркеров) или None - все задачи
+        self.shard = shard
+        # Общий лимит отправок всех задач (сообщений в секунду)
+        self.bucket = TokenBucket(rate)
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._next_run_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        """Цикл диспетчера работает"""
+        return self._task is not None and not self._task.done()
+
+    def register(self, kind: str, handler: JobHandler):
+        """Регистрация обработчика для типа задачи"""
+        self._handlers[kind] = handler
+
+    async def schedule(self, user_id: int, kind: str, delay: float, unique: bool = False) -> bool:
+        """Постановка задачи через delay секунд (unique - не дублировать задачу kind)"""
+        run_at = time.time() + delay
+        if not await self.db.schedule_job(user_id, kind, run_at, unique):
+            return False
+
+        # Будим диспетчер, только если новая задача раньше ожидаемой
+        if self._next_run_at is None or run_at < self._next_run_at:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        """Запуск диспетчера"""
+        released = await self.db.release_stale_jobs(self.shard)
+        if released:
+            logger.info(f"Возвращено в очередь незавершенных задач: {released}")
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info("Планировщик задач запущен")
+
+    async def stop(self):
+        """Остановка диспетчера"""
+        if self._task:
+            # Флаг нужен на случай, если wait_for проглотит отмену
+            self._running = False
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Планировщик задач остановлен")
+
+    async def _run(self):
+        """Основной цикл: сон до ближайшей задачи и выполнение пачек"""
+        while self._running:
+            try:
+                # Сбрасываем событие до запроса к БД, чтобы не потерять пробуждение
+                self._wakeup.clear()
+                next_run_at = await self.db.get_next_job_time(self.shard)
+                now = time.time()
+
+                if next_run_at is None or next_run_at > now:
+                    self._next_run_at = next_run_at
+                    timeout = self.idle_timeout
+                    if next_run_at is not None:
+                        timeout = min(next_run_at - now, timeout)
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                jobs = await self.db.claim_due_jobs(now, self.batch_size, self.shard)
+                if jobs:
+                    await asyncio.gather(*(self._execute(job) for job in jobs))
+                else:
+                    # Задачу забрали раньше нас - не крутим цикл вхолостую
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в цикле планировщика: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+    async def _execute(self, job: Dict):
+        """Выполнение одной задачи"""
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            logger.error(f"Неизвестный тип задачи {job['kind']} (id={job['id']})")
+            await self.db.complete_job(job["id"])
+            return
+
+        await self.bucket.acquire()
+        try:
+            await handler(self.bot, job["user_id"])
+        except Exception as e:
+            if isinstance(e, TelegramRetryAfter):
+                self.bucket.penalize(e.retry_after)
+            attempts = job["attempts"] + 1
+            if attempts >= self.max_attempts:
+                logger.error(
+                    f"Задача {job['kind']} для {job['user_id']} отброшена "
+                    f"после {attempts} попыток: {e}"
+                )
+                await self.db.complete_job(job["id"])
+            else:
+                # Нарастающая пауза, но не раньше, чем разрешил Telegram
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                if isinstance(e, TelegramRetryAfter):
+                    delay = max(delay, e.retry_after)
+                logger.warning(
+                    f"Задача {job['kind']} для {job['user_id']} завершилась ошибкой, "
+                    f"повтор через {delay} сек: {e}"
+                )
+                await self.db.retry_job(job["id"], time.time() + delay)
+            return
+
+        self.bucket.reward()
+        await self.db.complete_job(job["id"])
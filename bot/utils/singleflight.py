@@ -0,0 +1,44 @@
+"""
+Объединение одновременных вызовов с одним ключом (single flight)
+
+Пока вызов по ключу выполняется, повторные вызовы с тем же ключом
+не запускают работу заново, а ждут и получают тот же результат
+(или то же исключение).
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .metrics import SINGLEFLIGHT_SHARED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Один выполняющийся вызов на ключ"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Результат fn(), общий для всех, кто вызвал do с key во время выполнения"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            SINGLEFLIGHT_SHARED.inc(name=self.name)
+
+        # Отмена одного из ожидающих не отменяет общий вызов
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Исключение могло остаться без ожидающих - помечаем его прочитанным
+        if not future.cancelled():
+            future.exception()
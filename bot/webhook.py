@@ -0,0 +1,105 @@
+"""
+Прием обновлений через вебхук (aiohttp)
+"""
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from bot.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с ограничением числа обновлений в обработке
+
+    Пока все слоты заняты, ответ Telegram задерживается, и он сам
+    придерживает доставку (не больше max_connections запросов одновременно).
+
+    С route обновление не обрабатывается здесь, а передается дальше
+    (кластерный режим: фронт отправляет его воркеру).
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        max_in_flight: int,
+        route: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._route = route
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._in_flight.acquire()
+        try:
+            return await super()._handle_request_background(bot, request)
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            if self._route is not None:
+                await self._route(update)
+            else:
+                await super()._background_feed_update(bot, update)
+        finally:
+            self._in_flight.release()
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    route: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+):
+    """Запуск aiohttp сервера и регистрация вебхука в Telegram"""
+    # Без заданного секрета генерируем новый при каждом запуске
+    secret_token = config.webhook_secret or secrets.token_urlsafe(32)
+
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        max_in_flight=config.max_in_flight_updates,
+        route=route,
+    )
+    handler.register(app, path=config.webhook_path)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.webapp_host, port=config.webapp_port)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает {config.webapp_host}:{config.webapp_port}")
+
+    try:
+        # Вебхук не удаляем при остановке: Telegram придержит обновления до перезапуска
+        await bot.set_webhook(
+            url=config.webhook_url.rstrip("/") + config.webhook_path,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=config.webhook_max_connections,
+        )
+        logger.info(f"Вебхук установлен: {config.webhook_url.rstrip('/')}{config.webhook_path}")
+
+        # Работаем до SIGINT/SIGTERM (docker stop)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Windows: остановка через KeyboardInterrupt
+                pass
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,44 @@
+"""
+Общие фикстуры тестов
+
+Конфигурация бота читается при импорте модулей bot: подставляем
+тестовые значения до первого импорта.
+"""
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "@test_channel")
+
+from bot.database import Database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+def run_db(db_path):
+    """
+    Выполнение сценария с подключенной временной БД
+
+    Соединения aiosqlite привязаны к event loop, поэтому подключение,
+    сценарий и отключение идут в одном asyncio.run.
+    """
+
+    def run(scenario, **kwargs):
+        async def main():
+            db = Database(db_path, **kwargs)
+            await db.connect()
+            try:
+                return await scenario(db)
+            finally:
+                await db.disconnect()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,68 @@
+"""
+Архивация старых сообщений (archive_messages)
+"""
+import asyncio
+import sqlite3
+
+
+async def add_messages(db, count: int, days_ago_start: int, text: str = "old"):
+    """Старые сообщения: чем больше id, тем раньше created_at"""
+    for i in range(count):
+        await db._write(
+            """
+            INSERT INTO messages (user_id, message_text, created_at)
+            VALUES (1, ?, datetime('now', ?))
+            """,
+            (f"{text} {i}", f"-{days_ago_start + i} days"),
+        )
+
+
+def test_old_messages_move_to_archive(run_db):
+    async def scenario(db):
+        await db.add_user(1, "user", "User")
+        await add_messages(db, 30, days_ago_start=200)
+        for i in range(5):
+            await db.save_message(1, f"new {i}")
+
+        before = await db.get_stats()
+        moved = await db.archive_messages(90, batch_size=7, pause=0)
+        after = await db.get_stats()
+        recounted = await db.recount_stats()
+        recent = await db.get_user_messages(1, limit=100)
+        everything = await db.get_user_messages(1, limit=100, include_archive=True)
+        return moved, before, after, recounted, recent, everything
+
+    moved, before, after, recounted, recent, everything = run_db(scenario)
+    assert moved == 30
+    # Архивные сообщения остаются в total_messages
+    assert before == after == recounted
+    assert sorted(m["message_text"] for m in recent) == [f"new {i}" for i in range(5)]
+    texts = {m["message_text"] for m in everything}
+    assert texts == {f"old {i}" for i in range(30)} | {f"new {i}" for i in range(5)}
+
+
+def test_archive_batches_are_bounded(run_db, db_path, monkeypatch):
+    real_sleep = asyncio.sleep
+    archived_after_batch = []
+
+    async def spy_sleep(delay, *args, **kwargs):
+        # Пауза между пачками: предыдущая транзакция уже закоммичена
+        with sqlite3.connect(db_path) as connection:
+            (count,) = connection.execute("SELECT COUNT(*) FROM messages_archive").fetchone()
+        archived_after_batch.append(count)
+        await real_sleep(0)
+
+    async def scenario(db):
+        await db.add_user(1, "user", "User")
+        # Часть старых сообщений "импортирована" с id больше новых
+        await db.save_message(1, "new")
+        await add_messages(db, 20, days_ago_start=200)
+        await db.save_message(1, "new")
+        monkeypatch.setattr(asyncio, "sleep", spy_sleep)
+        try:
+            return await db.archive_messages(90, batch_size=6, pause=0.01)
+        finally:
+            monkeypatch.setattr(asyncio, "sleep", real_sleep)
+
+    assert run_db(scenario) == 20
+    assert archived_after_batch == [6, 12, 18, 20]
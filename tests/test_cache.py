@@ -0,0 +1,84 @@
+"""
+LRU-кэш с TTL (bot/cache.py) и кэш профилей пользователей в Database
+"""
+import time
+
+from bot.cache import TTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(maxsize=3)
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.get("a") == "A"  # "a" становится самым свежим
+    cache.set("d", "D")
+
+    assert "b" not in cache
+    assert [cache.peek(key) for key in "acd"] == ["A", "C", "D"]
+    assert cache.evictions == 1
+    assert len(cache) == 3
+
+
+def test_entries_without_ttl_never_expire():
+    cache = TTLCache(maxsize=10)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.peek("a") == 1
+
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("default", 1)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.1)
+
+    assert cache.get("default") is None
+    assert cache.get("long") == 2
+    assert "default" not in cache
+
+
+def test_stats_count_hits_and_misses():
+    cache = TTLCache(maxsize=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+    cache.peek("a")
+    cache.peek("missing")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_cached_user_follows_updates(run_db):
+    async def scenario(db):
+        await db.add_user(5, "old", "Old")
+        first = await db.get_user(5)
+        assert await db.get_user(5) is first  # второй раз - из кэша
+
+        await db.update_user_subscription(5, True)
+        await db.mark_file_received(5)
+        await db.add_user(5, "new", "New")
+        cached = await db.get_user(5)
+
+        db.user_cache.clear()
+        fresh = await db.get_user(5)
+        return cached, fresh, db.user_cache.stats()
+
+    cached, fresh, stats = run_db(scenario)
+    for user in (cached, fresh):
+        assert (user.username, user.is_subscribed, user.received_file) == ("new", True, True)
+    assert stats["hits"] >= 2
+
+
+def test_user_cache_is_bounded(run_db):
+    async def scenario(db):
+        for user_id in range(1, 21):
+            await db.add_user(user_id, f"user{user_id}")
+            await db.get_user(user_id)
+        return len(db.user_cache), await db.get_user(1)
+
+    size, user = run_db(scenario, user_cache_size=5)
+    assert size == 5
+    assert user.user_id == 1
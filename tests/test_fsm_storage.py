@@ -0,0 +1,78 @@
+"""
+Хранилище состояний FSM в SQLite (bot/database/storage.py)
+"""
+import asyncio
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.database import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+class Form(StatesGroup):
+    waiting = State()
+
+
+def test_round_trip_survives_restart(run_db):
+    async def scenario(db):
+        storage = SQLiteStorage(db)
+        await storage.set_state(KEY, Form.waiting)
+        await storage.set_data(KEY, {"text": "привет", "ids": [1, 2]})
+
+        # Новое хранилище с пустым кэшем читает из БД
+        restarted = SQLiteStorage(db)
+        return (
+            await restarted.get_state(KEY),
+            await restarted.get_data(KEY),
+            await restarted.get_state(OTHER),
+            await restarted.get_data(OTHER),
+        )
+
+    state, data, other_state, other_data = run_db(scenario)
+    assert state == Form.waiting.state
+    assert data == {"text": "привет", "ids": [1, 2]}
+    assert other_state is None and other_data == {}
+
+
+def test_cleared_state_is_deleted(run_db):
+    async def scenario(db):
+        storage = SQLiteStorage(db)
+        await storage.set_state(KEY, Form.waiting)
+        await storage.set_data(KEY, {"a": 1})
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        return await db.get_fsm_record(SQLiteStorage._db_key(KEY))
+
+    assert run_db(scenario) is None
+
+
+def test_get_data_returns_copy(run_db):
+    async def scenario(db):
+        storage = SQLiteStorage(db)
+        await storage.set_data(KEY, {"a": 1})
+        data = await storage.get_data(KEY)
+        data["a"] = 2
+        return await storage.get_data(KEY)
+
+    assert run_db(scenario) == {"a": 1}
+
+
+def test_abandoned_state_expires(run_db):
+    async def scenario(db):
+        storage = SQLiteStorage(db)
+        await storage.set_state(KEY, Form.waiting)
+        await asyncio.sleep(0.15)
+
+        expired = await SQLiteStorage(db).get_state(KEY)
+        cached = await storage.get_state(KEY)
+        purged = await db.purge_fsm_records()
+        return expired, cached, purged
+
+    expired, cached, purged = run_db(scenario, fsm_ttl=0.1)
+    assert expired is None
+    # Кэш держит запись не дольше, чем она живет в БД
+    assert cached is None
+    assert purged == 1
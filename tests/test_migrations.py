@@ -0,0 +1,104 @@
+"""
+Миграции схемы по PRAGMA user_version (bot/database/models.py)
+"""
+import asyncio
+import logging
+import sqlite3
+
+from bot.database import Database
+from bot.database.models import SCHEMA_VERSION
+
+# Схема до нумерации версий (user_version = 0)
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER UNIQUE NOT NULL,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    is_subscribed BOOLEAN DEFAULT 0,
+    received_file BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message_text TEXT NOT NULL,
+    is_from_admin BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE INDEX idx_user_id ON users(user_id);
+CREATE INDEX idx_messages_user ON messages(user_id);
+CREATE INDEX idx_created_at ON messages(created_at);
+"""
+
+
+def make_baseline_db(path: str):
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+        connection.executemany(
+            "INSERT INTO users (user_id, username, is_subscribed, received_file) VALUES (?, ?, ?, ?)",
+            [(user_id, f"user{user_id}", user_id % 2, user_id % 3 == 0) for user_id in range(1, 11)],
+        )
+        connection.executemany(
+            "INSERT INTO messages (user_id, message_text) VALUES (?, ?)",
+            [(user_id, "hello") for user_id in range(1, 11) for _ in range(2)],
+        )
+    connection.close()
+
+
+def user_version(path: str) -> int:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_baseline_database_is_migrated(db_path):
+    make_baseline_db(db_path)
+
+    async def main():
+        db = Database(db_path)
+        await db.connect()
+        try:
+            stats = await db.get_stats()
+            user = await db.get_user(3)
+            scheduled = await db.schedule_job(3, "bonus_pdf", 0)
+            return stats, user, scheduled
+        finally:
+            await db.disconnect()
+
+    stats, user, scheduled = asyncio.run(main())
+    assert user_version(db_path) == SCHEMA_VERSION
+    # Счетчики посчитаны по уже существующим данным
+    assert stats == {
+        "total_users": 10,
+        "subscribed_users": 5,
+        "received_file": 3,
+        "total_messages": 20,
+    }
+    assert user.username == "user3" and user.received_file
+    assert scheduled
+
+
+def test_current_schema_is_not_migrated_again(run_db, db_path, caplog):
+    async def add_data(db):
+        await db.add_user(1, "user")
+        await db.save_message(1, "hello")
+
+    caplog.set_level(logging.INFO, logger="bot.database.db")
+    run_db(add_data)
+    assert user_version(db_path) == SCHEMA_VERSION
+    assert "применена миграция" in caplog.text
+
+    async def reconnect(db):
+        return await db.get_stats()
+
+    caplog.clear()
+    stats = run_db(reconnect)
+    assert "применена миграция" not in caplog.text
+    assert user_version(db_path) == SCHEMA_VERSION
+    assert stats["total_users"] == 1 and stats["total_messages"] == 1
@@ -0,0 +1,76 @@
+"""
+Keyset-пагинация пользователей (iter_users, get_users_page)
+"""
+import random
+
+
+def ids(page):
+    return [user["user_id"] for user in page]
+
+
+async def add_users(db, user_ids):
+    for user_id in user_ids:
+        await db.add_user(user_id, f"user{user_id}", f"User{user_id}")
+
+
+def test_iter_users_streams_everyone_in_order(run_db):
+    async def scenario(db):
+        user_ids = list(range(1, 26))
+        random.Random(1).shuffle(user_ids)
+        await add_users(db, user_ids)
+        return [user["user_id"] async for user in db.iter_users(batch_size=10)]
+
+    assert run_db(scenario) == list(range(1, 26))
+
+
+def test_iter_users_batch_boundary(run_db):
+    async def scenario(db):
+        await add_users(db, range(1, 21))
+        return [user["user_id"] async for user in db.iter_users(batch_size=10)]
+
+    assert run_db(scenario) == list(range(1, 21))
+
+
+def test_iter_users_empty(run_db):
+    async def scenario(db):
+        return [user async for user in db.iter_users()]
+
+    assert run_db(scenario) == []
+
+
+def test_users_page_forward_and_back(run_db):
+    async def scenario(db):
+        await add_users(db, range(1, 24))
+        # По три пользователя на секунду: одинаковые created_at различает id
+        await db._write(
+            "UPDATE users SET created_at = datetime('2024-01-01', '+' || (user_id / 3) || ' seconds')"
+        )
+        async with db._reader() as cursor:
+            await cursor.execute("SELECT user_id FROM users ORDER BY created_at DESC, id DESC")
+            expected = [row["user_id"] for row in await cursor.fetchall()]
+
+        pages = []
+        rows, has_more = await db.get_users_page(limit=5)
+        pages.append(rows)
+        while has_more:
+            last = rows[-1]
+            rows, has_more = await db.get_users_page((last["created_at"], last["id"]), limit=5)
+            pages.append(rows)
+
+        back = [pages[-1]]
+        rows = pages[-1]
+        while True:
+            first = rows[0]
+            rows, has_more = await db.get_users_page(
+                (first["created_at"], first["id"]), backward=True, limit=5
+            )
+            back.append(rows)
+            if not has_more:
+                break
+        return expected, pages, back
+
+    expected, pages, back = run_db(scenario)
+    assert [user_id for page in pages for user_id in ids(page)] == expected
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    # Назад - те же страницы в обратном порядке
+    assert [ids(page) for page in reversed(back)] == [ids(page) for page in pages]
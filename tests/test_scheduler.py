@@ -0,0 +1,198 @@
+"""
+Планировщик отложенных задач (bot/utils/scheduler.py)
+"""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.handlers import start
+from bot.utils import JobScheduler
+
+
+async def wait_for(predicate, timeout: float = 5.0):
+    """Ожидание условия (задачи выполняются в фоновом цикле)"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "условие не выполнилось вовремя"
+        await asyncio.sleep(0.01)
+
+
+def make_scheduler(db, **kwargs) -> JobScheduler:
+    kwargs.setdefault("retry_delay", 0.01)
+    kwargs.setdefault("poll_interval", 0.01)
+    kwargs.setdefault("rate", 1000)
+    return JobScheduler(None, db, **kwargs)
+
+
+def test_job_runs_once_and_is_removed(run_db):
+    async def scenario(db):
+        scheduler = make_scheduler(db)
+        calls = []
+
+        async def handler(bot, user_id):
+            calls.append(user_id)
+
+        scheduler.register("hello", handler)
+        await scheduler.start()
+        try:
+            assert await scheduler.schedule(42, "hello", 0)
+            await wait_for(lambda: calls)
+            await asyncio.sleep(0.05)
+        finally:
+            await scheduler.stop()
+        assert calls == [42]
+        assert await db.count_pending_jobs() == 0
+
+    run_db(scenario)
+
+
+def test_unique_job_is_not_duplicated(run_db):
+    async def scenario(db):
+        scheduler = make_scheduler(db)
+        assert await scheduler.schedule(1, "bonus", 60, unique=True)
+        assert not await scheduler.schedule(1, "bonus", 60, unique=True)
+        assert await scheduler.schedule(2, "bonus", 60, unique=True)
+        assert await db.count_pending_jobs() == 2
+
+    run_db(scenario)
+
+
+def test_failed_job_is_retried(run_db):
+    async def scenario(db):
+        scheduler = make_scheduler(db)
+        calls = []
+
+        async def handler(bot, user_id):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise TelegramNetworkError(SendMessage(chat_id=user_id, text="x"), "timeout")
+
+        scheduler.register("flaky", handler)
+        await scheduler.start()
+        try:
+            await scheduler.schedule(1, "flaky", 0)
+            await wait_for(lambda: len(calls) == 2)
+        finally:
+            await scheduler.stop()
+        assert await db.count_pending_jobs() == 0
+
+    run_db(scenario)
+
+
+def test_job_is_dropped_after_max_attempts(run_db):
+    async def scenario(db):
+        scheduler = make_scheduler(db, max_attempts=3)
+        calls = []
+
+        async def handler(bot, user_id):
+            calls.append(user_id)
+            raise RuntimeError("всегда ошибка")
+
+        scheduler.register("broken", handler)
+        await scheduler.start()
+        try:
+            await scheduler.schedule(1, "broken", 0)
+            await wait_for(lambda: len(calls) == 3)
+            await asyncio.sleep(0.05)
+        finally:
+            await scheduler.stop()
+        assert len(calls) == 3
+        assert await db.count_pending_jobs() == 0
+
+    run_db(scenario)
+
+
+def test_retry_waits_for_retry_after(run_db):
+    async def scenario(db):
+        scheduler = make_scheduler(db)
+        calls = []
+
+        async def handler(bot, user_id):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise TelegramRetryAfter(
+                    SendMessage(chat_id=user_id, text="x"), "Too Many Requests", retry_after=1
+                )
+
+        scheduler.register("limited", handler)
+        await scheduler.start()
+        try:
+            await scheduler.schedule(1, "limited", 0)
+            await wait_for(lambda: len(calls) == 2, timeout=5)
+        finally:
+            await scheduler.stop()
+        assert calls[1] - calls[0] >= 0.9
+
+    run_db(scenario)
+
+
+def test_sends_are_rate_limited(run_db):
+    async def scenario(db):
+        # Корзина на 5 токенов, 5 в секунду: 15 задач - не меньше 2 секунд
+        scheduler = make_scheduler(db, rate=5)
+        calls = []
+
+        async def handler(bot, user_id):
+            calls.append(time.monotonic())
+
+        scheduler.register("send", handler)
+        for user_id in range(15):
+            await scheduler.schedule(user_id, "send", 0)
+        started = time.monotonic()
+        await scheduler.start()
+        try:
+            await wait_for(lambda: len(calls) == 15, timeout=10)
+        finally:
+            await scheduler.stop()
+        assert calls[-1] - started >= 1.8
+
+    run_db(scenario)
+
+
+class FakeBot:
+    def __init__(self, events):
+        self.events = events
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.events.append(("contact", chat_id))
+
+
+class FakeAssets:
+    """Первая отправка PDF падает с сетевой ошибкой"""
+
+    def __init__(self, events):
+        self.events = events
+        self.failed = False
+
+    async def send_document(self, bot, chat_id, path, caption=None):
+        if not self.failed:
+            self.failed = True
+            raise TelegramNetworkError(SendMessage(chat_id=chat_id, text="x"), "timeout")
+        self.events.append(("bonus", chat_id))
+
+
+def test_contact_follows_retried_bonus(run_db, monkeypatch):
+    monkeypatch.setattr(start, "DELAY_BONUS", 0)
+    monkeypatch.setattr(start, "DELAY_CONTACT", 0)
+
+    async def scenario(db):
+        events = []
+        scheduler = make_scheduler(db)
+        scheduler.bot = FakeBot(events)
+        start.register_jobs(scheduler, db, FakeAssets(events))
+
+        await db.add_user(7, "user", "User")
+        await scheduler.start()
+        try:
+            assert await start.schedule_delayed_messages(scheduler, 7)
+            assert not await start.schedule_delayed_messages(scheduler, 7)
+            await wait_for(lambda: len(events) == 2)
+        finally:
+            await scheduler.stop()
+
+        assert events == [("bonus", 7), ("contact", 7)]
+        assert (await db.get_user(7)).received_file
+
+    run_db(scenario)
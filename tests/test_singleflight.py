@@ -0,0 +1,82 @@
+"""
+Объединение одновременных вызовов (bot/utils/singleflight.py)
+"""
+import asyncio
+
+import pytest
+
+from bot.utils import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        other = await flight.do("other", work)
+        return results, other, len(calls), len(flight)
+
+    results, other, calls, pending = asyncio.run(main())
+    assert results == ["result"] * 5
+    assert other == "result"
+    assert calls == 2
+    assert pending == 0
+
+
+def test_next_call_after_completion_runs_again():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        return await flight.do("key", work), await flight.do("key", work)
+
+    assert asyncio.run(main()) == (1, 2)
+
+
+def test_exception_is_shared():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("key", work) for _ in range(3)), return_exceptions=True
+        )
+        return results, len(calls)
+
+    results, calls = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == 1
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
@@ -0,0 +1,49 @@
+"""
+Счетчики статистики, которые ведут триггеры (stats_counters)
+"""
+import random
+
+
+def test_counters_match_table_counts(run_db):
+    async def scenario(db):
+        rng = random.Random(8)
+        for user_id in range(1, 61):
+            await db.add_user(user_id, f"user{user_id}", f"User{user_id}")
+        for _ in range(300):
+            user_id = rng.randint(1, 70)
+            action = rng.choice(("add", "subscribe", "unsubscribe", "file", "message"))
+            if action == "add":
+                await db.add_user(user_id, f"user{user_id}", f"User{user_id}")
+            elif action == "subscribe":
+                await db.update_user_subscription(user_id, True)
+            elif action == "unsubscribe":
+                await db.update_user_subscription(user_id, False)
+            elif action == "file":
+                await db.mark_file_received(user_id)
+            else:
+                await db.save_message(user_id, "text")
+        await db._write("DELETE FROM users WHERE user_id % 7 = 0")
+        await db._write("DELETE FROM messages WHERE id % 5 = 0")
+
+        counters = await db.get_stats()
+        # recount_stats считает заново по таблицам
+        return counters, await db.recount_stats()
+
+    counters, recounted = run_db(scenario)
+    assert counters == recounted
+    assert counters["total_users"] > 0 and counters["total_messages"] > 0
+
+
+def test_repeated_flags_do_not_double_count(run_db):
+    async def scenario(db):
+        await db.add_user(1, "user", "User")
+        await db.add_user(1, "user", "User")
+        for _ in range(3):
+            await db.update_user_subscription(1, True)
+            await db.mark_file_received(1)
+        return await db.get_stats()
+
+    stats = run_db(scenario)
+    assert stats["total_users"] == 1
+    assert stats["subscribed_users"] == 1
+    assert stats["received_file"] == 1
@@ -0,0 +1,87 @@
+"""
+Ограничение частоты обновлений (bot/middlewares/throttling.py)
+"""
+import asyncio
+
+import pytest
+from aiogram.types import Update, User
+
+from bot.middlewares import ThrottlingMiddleware, TokenBuckets
+
+
+def test_burst_then_limit():
+    buckets = TokenBuckets(rate=1, burst=3)
+    assert [buckets.acquire(1, now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Токенов нет: без ожидания - отказ, с ожиданием - задержка
+    assert buckets.acquire(1, max_delay=0, now=100.0) is None
+    assert buckets.acquire(1, max_delay=2, now=100.0) == pytest.approx(1.0)
+    # Токен взят в долг: следующий ждет дольше
+    assert buckets.acquire(1, max_delay=0, now=101.0) is None
+    assert buckets.acquire(1, now=102.0) == 0.0
+
+
+def test_keys_are_independent():
+    buckets = TokenBuckets(rate=1, burst=1)
+    assert buckets.acquire(1, now=0.0) == 0.0
+    assert buckets.acquire(1, now=0.0) is None
+    assert buckets.acquire(2, now=0.0) == 0.0
+
+
+def test_table_size_is_fixed():
+    buckets = TokenBuckets(rate=1, burst=2, slots=8, probes=8)
+    # Все ключи одновременно: ячейки не успевают освободиться сами
+    for key in range(1, 1001):
+        buckets.acquire(key, now=0.0)
+    assert len(buckets) == 8
+    assert buckets.evictions == 1000 - 8
+    # Вытесненный ключ получает полную корзину
+    assert buckets.acquire(1, now=2000.0) == 0.0
+
+
+def make_update(update_id: int, **event) -> Update:
+    return Update(update_id=update_id, **event)
+
+
+USER = {"id": 5, "is_bot": False, "first_name": "User"}
+CHAT = {"id": 5, "type": "private"}
+
+
+def message(message_id: int, **extra) -> dict:
+    return dict({"message_id": message_id, "date": 0, "chat": CHAT, "from": USER, "text": "t"}, **extra)
+
+
+def run_middleware(middleware, updates, user_id: int = 5):
+    async def handler(event, data):
+        return "handled"
+
+    async def main():
+        data = {"event_from_user": User(id=user_id, is_bot=False, first_name="User")}
+        return [await middleware(handler, update, data) for update in updates]
+
+    return asyncio.run(main())
+
+
+def test_extra_updates_are_dropped():
+    middleware = ThrottlingMiddleware(rate=1, burst=2, max_delay=0)
+    results = run_middleware(middleware, [make_update(i, message=message(i)) for i in range(4)])
+    assert results == ["handled", "handled", None, None]
+
+
+def test_admin_is_not_throttled():
+    middleware = ThrottlingMiddleware(rate=1, burst=1, max_delay=0, exempt=(5,))
+    results = run_middleware(middleware, [make_update(i, message=message(i)) for i in range(4)])
+    assert results == ["handled"] * 4
+
+
+def test_album_parts_and_chat_member_are_not_throttled():
+    middleware = ThrottlingMiddleware(rate=1, burst=1, max_delay=0)
+    album = [make_update(i, message=message(i, media_group_id="album")) for i in range(5)]
+    member = make_update(100, chat_member={
+        "chat": {"id": -100, "type": "channel"},
+        "from": USER,
+        "date": 0,
+        "old_chat_member": {"status": "left", "user": USER},
+        "new_chat_member": {"status": "member", "user": USER},
+    })
+    results = run_middleware(middleware, [make_update(0, message=message(0)), *album, member])
+    assert results == ["handled"] * 7